@@ -648,14 +648,23 @@ async loadAdminData(retryCount = 0) {
     // 导出平台数据
     async exportPlatformData() {
         try {
-            const data = await Utils.apiRequest('/admin/export-data');
+            // 导出为流式 NDJSON（gzip 压缩），直接保存响应内容
+            Utils.showLoading();
+            const response = await fetch(`${API_BASE}/admin/export-data?gzip=1`, {
+                headers: { 'Authorization': `Bearer ${Utils.getAuthToken()}` }
+            });
+            
+            if (!response.ok) {
+                const data = await response.json();
+                throw new Error(data.message || '请求失败');
+            }
             
             // 创建下载链接
-            const blob = new Blob([JSON.stringify(data, null, 2)], { type: 'application/json' });
+            const blob = await response.blob();
             const url = URL.createObjectURL(blob);
             const a = document.createElement('a');
             a.href = url;
-            a.download = `ctf_export_${new Date().toISOString().split('T')[0]}.json`;
+            a.download = `ctf_export_${new Date().toISOString().split('T')[0]}.ndjson.gz`;
             document.body.appendChild(a);
             a.click();
             document.body.removeChild(a);
@@ -664,6 +673,8 @@ async loadAdminData(retryCount = 0) {
             Utils.showAlert('数据导出成功!', 'success');
         } catch (error) {
             Utils.showAlert('导出数据失败: ' + error.message, 'danger');
+        } finally {
+            Utils.hideLoading();
         }
     },
     
@@ -1,6 +1,7 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 from flask_migrate import Migrate
+import click
 import os
 import sys
 from datetime import datetime
@@ -11,7 +12,17 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from config import get_config
 from models import db, init_db
 from utils.log import setup_logging, request_logger
-from utils.auth import token_required
+from utils.leaderboard import leaderboard_index
+from utils.catalog import challenge_catalog
+from utils.ratelimit import submission_limiter
+from utils.submission_buffer import submission_buffer
+from utils.flag import dynamic_flag_index
+from utils.score_scheduler import score_scheduler
+from utils.auth import token_required, identity_cache
+from utils.password_pool import password_pool
+from utils.metrics import request_metrics
+from utils.query_monitor import query_monitor
+from utils.profiler import request_profiler
 
 # 导入路由蓝图
 from routes.auth import auth_bp
@@ -39,6 +50,37 @@ def create_app(config_class=None):
     setup_logging(app)
     request_logger.init_app(app)
     
+    # 初始化 SQL 查询监控和请求延迟指标
+    query_monitor.init_app(app)
+    request_metrics.init_app(app)
+    
+    # 初始化按需请求性能分析（未启用时不注册钩子）
+    request_profiler.init_app(app)
+    
+    # 初始化用户身份缓存
+    identity_cache.init_app(app)
+    
+    # 初始化密码哈希工作池
+    password_pool.init_app(app)
+    
+    # 初始化内存排行榜索引
+    leaderboard_index.init_app(app)
+    
+    # 初始化题目目录缓存
+    challenge_catalog.init_app(app)
+    
+    # 初始化提交限流器
+    submission_limiter.init_app(app)
+    
+    # 初始化错误提交写后缓冲
+    submission_buffer.init_app(app)
+    
+    # 初始化动态Flag反查索引
+    dynamic_flag_index.init_app(app)
+    
+    # 初始化动态分数后台调度器
+    score_scheduler.init_app(app)
+    
     # 创建必要的目录
     create_directories(app)
     
@@ -103,6 +145,17 @@ def register_blueprints(app):
             'timestamp': datetime.utcnow().isoformat(),
             'database': db_status
         })
+    
+    # Prometheus 指标路由（设置 METRICS_TOKEN 时需要 Bearer 令牌）
+    @app.route('/metrics')
+    def metrics():
+        if not request_metrics.enabled:
+            return jsonify({'message': 'Metrics are disabled'}), 404
+        
+        if request_metrics.token and request.headers.get('Authorization') != f'Bearer {request_metrics.token}':
+            return jsonify({'message': 'Invalid metrics token'}), 401
+        
+        return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
 
 def register_error_handlers(app):
     """注册错误处理器"""
@@ -153,6 +206,18 @@ def register_commands(app):
             init_db(app)
             print("数据库初始化完成！")
     
+    @app.cli.command('upgrade-db')
+    def upgrade_database():
+        """为已有数据库补充新增的列和索引（可重复执行）"""
+        from models import upgrade_schema
+        
+        with app.app_context():
+            statements = upgrade_schema()
+        
+        for statement in statements:
+            print(statement)
+        print(f"数据库结构升级完成，执行 {len(statements)} 条语句")
+    
     @app.cli.command('create-admin')
     def create_admin():
         """创建管理员用户"""
@@ -179,34 +244,154 @@ def register_commands(app):
             
             print(f"管理员用户 {username} 创建成功！")
     
+    @app.cli.command('import-users')
+    @click.argument('csv_file', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--batch-size', default=1000, show_default=True, help='每批处理的行数')
+    @click.option('--workers', type=int, help='哈希进程数，默认为 CPU 核数')
+    @click.option('--dry-run', is_flag=True, help='只校验，不写入数据库')
+    def import_users(csv_file, batch_size, workers, dry_run):
+        """从 CSV 批量导入用户（列：username, email, password）"""
+        from utils.user_import import import_users as run_import
+        
+        with app.app_context():
+            try:
+                stats = run_import(csv_file, batch_size=batch_size, workers=workers, dry_run=dry_run)
+            except ValueError as e:
+                raise click.ClickException(str(e))
+        
+        for error in stats['errors']:
+            print(f"第 {error['line']} 行: {error['error']}")
+        print(f"{'校验完成' if dry_run else '导入完成'}！共 {stats['rows']} 行，"
+              f"{'可导入' if dry_run else '新增'} {stats['created']}，已存在 {stats['existing']}，"
+              f"文件内重复 {stats['duplicates']}，无效 {stats['invalid']}，耗时 {stats['duration_ms']}ms"
+              + (f"，{stats['users_per_second']} 用户/秒" if stats['users_per_second'] else ''))
+    
     @app.cli.command('update-scores')
     def update_scores():
         """更新题目动态分数"""
         from utils.scoring import ScoringSystem
         
         with app.app_context():
-            ScoringSystem.update_challenge_scores()
-            print("题目分数更新完成！")
+            try:
+                stats = ScoringSystem.update_challenge_scores()
+            except RuntimeError as e:
+                raise click.ClickException(str(e))
+            print(f"题目分数更新完成！题目 {stats['challenges_updated']}/{stats['challenges']}，"
+                  f"用户 {stats['users_updated']}/{stats['users']}，耗时 {stats['duration_ms']}ms")
     
-    @app.cli.command('export-data')
-    def export_data():
-        """导出平台数据"""
-        import json
-        from models import User, Challenge, Submission, Contest
+    @app.cli.command('replay-scores')
+    @click.option('--dry-run', is_flag=True, help='只统计差异，不写入数据库')
+    @click.option('--batch-size', default=5000, show_default=True, help='每批读取和写入的行数')
+    def replay_scores(dry_run, batch_size):
+        """按提交记录重放计分，修复解题记录、解题人数、一血和用户总分"""
+        from utils.replay import replay_scores as replay
         
         with app.app_context():
-            data = {
-                'export_time': datetime.utcnow().isoformat(),
-                'users': [user.to_dict() for user in User.query.all()],
-                'challenges': [challenge.to_dict() for challenge in Challenge.query.all()],
-                'submissions': [submission.to_dict() for submission in Submission.query.limit(1000).all()]
-            }
-            
-            export_file = f'ctf_export_{datetime.utcnow().strftime("%Y%m%d_%H%M%S")}.json'
-            with open(export_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            stats = replay(batch_size=batch_size, dry_run=dry_run)
+        
+        print(f"{'差异统计' if dry_run else '重放完成'}！扫描正确提交 {stats['submissions_scanned']}，"
+              f"解题记录 {stats['solves']}（新增 {stats['solves_inserted']}，更新 {stats['solves_updated']}，"
+              f"删除 {stats['solves_deleted']}），题目更新 {stats['challenges_updated']}，"
+              f"用户更新 {stats['users_updated']}，耗时 {stats['duration_ms']}ms")
+    
+    @app.cli.command('simulate-scores')
+    @click.option('--params', 'params_file', type=click.Path(exists=True, dir_okay=False),
+                  help='JSON 文件：一组参数对象或参数对象列表（可带 name 字段）')
+    @click.option('--set', 'overrides', multiple=True, help='参数覆盖 KEY=VALUE，如 difficulty.hard=1.8')
+    @click.option('--as-of', help='计算时间衰减的时间点（ISO 格式），默认为当前时间')
+    @click.option('--top', default=10, show_default=True, help='每组输出的用户数')
+    @click.option('--json', 'as_json', is_flag=True, help='以 JSON 输出完整结果')
+    def simulate_scores(params_file, overrides, as_of, top, as_json):
+        """模拟不同计分参数下的排名变化（不修改数据库）"""
+        import json
+        from utils.simulator import ScoreSimulator, parse_overrides
+        
+        try:
+            param_sets = []
+            if params_file:
+                with open(params_file, encoding='utf-8') as f:
+                    loaded = json.load(f)
+                param_sets.extend(loaded if isinstance(loaded, list) else [loaded])
+            if overrides:
+                param_sets.append(parse_overrides(overrides))
+            if not param_sets:
+                raise click.UsageError('请通过 --params 或 --set 指定至少一组计分参数')
             
-            print(f"数据已导出到: {export_file}")
+            with app.app_context():
+                report = ScoreSimulator().simulate(
+                    param_sets,
+                    as_of=datetime.fromisoformat(as_of) if as_of else None,
+                    top=top
+                )
+        except (ValueError, RuntimeError) as e:
+            raise click.ClickException(str(e))
+        
+        if as_json:
+            print(json.dumps(report, ensure_ascii=False, indent=2))
+            return
+        
+        print(f"用户 {report['users']}，题目 {report['challenges']}，解题记录 {report['solves']}；"
+              f"加载 {report['load_ms']}ms，模拟 {report['simulate_ms']}ms")
+        for result in report['results']:
+            print(f"\n[{result['name']}] 题目分数变化 {result['challenges_changed']}，"
+                  f"排名变化 {result['users_moved']} 人，最大上升 {result['max_rise']}，"
+                  f"最大下降 {result['max_drop']}，前 {top} 名变动 {result['top_changed']} 人")
+            for row in result['movers']:
+                print(f"  {row['username']:<20} #{row['old_rank']} -> #{row['new_rank']}  "
+                      f"{row['old_score']} -> {row['new_score']}")
+    
+    @app.cli.command('export-data')
+    @click.option('--output', '-o', help='输出文件路径，默认为 ctf_export_<时间>.ndjson[.gz]')
+    @click.option('--gzip', 'compress', is_flag=True, help='gzip 压缩输出')
+    @click.option('--batch-size', default=5000, show_default=True, help='游标每批读取的行数')
+    def export_data(output, compress, batch_size):
+        """以 NDJSON 流式导出平台数据（含全部提交记录）"""
+        import time
+        from utils.export import iter_export_bytes
+        
+        export_file = output or f'ctf_export_{datetime.utcnow().strftime("%Y%m%d_%H%M%S")}.ndjson' + ('.gz' if compress else '')
+        start_time = time.perf_counter()
+        counts = {}
+        size = 0
+        
+        with app.app_context():
+            with open(export_file, 'wb') as f:
+                for chunk in iter_export_bytes(compress=compress, batch_size=batch_size, counts=counts):
+                    f.write(chunk)
+                    size += len(chunk)
+        
+        duration = time.perf_counter() - start_time
+        rows = sum(counts.values())
+        print(f"数据已导出到: {export_file}")
+        print(f"分类 {counts.get('category', 0)}，用户 {counts.get('user', 0)}，"
+              f"题目 {counts.get('challenge', 0)}，提交记录 {counts.get('submission', 0)}；"
+              f"{size / 1024 / 1024:.1f}MB，耗时 {duration:.2f}s，{rows / duration:.0f} 行/秒")
+
+    @app.cli.command('export-analytics')
+    @click.argument('output_dir', type=click.Path(file_okay=False))
+    @click.option('--format', 'file_format', type=click.Choice(['parquet', 'arrow']), default='parquet', show_default=True, help='输出格式')
+    @click.option('--compression', default='zstd', show_default=True, help='压缩算法')
+    @click.option('--batch-size', default=50000, show_default=True, help='游标每批读取的行数')
+    @click.option('--include-flags', is_flag=True, help='导出提交的Flag内容')
+    def export_analytics(output_dir, file_format, compression, batch_size, include_flags):
+        """将提交记录、解题记录和得分事件导出为按天分区的列式文件（需要 pyarrow）"""
+        from utils.analytics_export import export_analytics as run_export
+        
+        with app.app_context():
+            try:
+                stats = run_export(
+                    output_dir,
+                    file_format=file_format,
+                    batch_size=batch_size,
+                    include_flags=include_flags,
+                    compression=compression
+                )
+            except (ValueError, RuntimeError) as e:
+                raise click.ClickException(str(e))
+        
+        print(f"数据已导出到: {output_dir}")
+        print(f"提交记录 {stats['submissions']}，解题记录 {stats['solves']}，得分事件 {stats['score_events']}；"
+              f"{stats['files']} 个文件，耗时 {stats['duration_ms']}ms")
 
 # 创建应用实例
 app = create_app()
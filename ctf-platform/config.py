@@ -54,21 +54,77 @@ class Config:
     # 日志配置
     LOG_LEVEL = os.environ.get('LOG_LEVEL') or 'INFO'
     LOG_FILE = os.path.join(UPLOAD_FOLDER, 'logs', 'ctf_platform.log')
+    LOG_FORMAT = os.environ.get('LOG_FORMAT') or 'text'  # text or json
+    LOG_ASYNC_ENABLED = os.environ.get('LOG_ASYNC_ENABLED', 'true').lower() == 'true'
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE') or 10000)  # 队列满时丢弃并计数
+    
+    # 指标配置（/metrics 以 Prometheus 文本格式导出，多进程快照同步间隔单位：秒）
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # 为空时不校验
+    METRICS_SYNC_INTERVAL = int(os.environ.get('METRICS_SYNC_INTERVAL') or 10)
+    METRICS_BUCKETS = [float(b) for b in os.environ.get('METRICS_BUCKETS', '').split(',') if b.strip()]  # 为空时使用默认分桶
+    
+    # SQL 查询监控配置（记录慢请求和疑似 N+1 查询）
+    QUERY_MONITOR_ENABLED = os.environ.get('QUERY_MONITOR_ENABLED', 'true').lower() == 'true'
+    QUERY_MONITOR_SLOW_REQUEST_MS = int(os.environ.get('QUERY_MONITOR_SLOW_REQUEST_MS') or 500)
+    QUERY_MONITOR_N_PLUS_ONE_THRESHOLD = int(os.environ.get('QUERY_MONITOR_N_PLUS_ONE_THRESHOLD') or 10)  # 同一语句每请求执行次数
+    
+    # 按需性能分析配置（管理员携带请求头或按比例抽样，结果保存在 TEMP_FOLDER/profiles）
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'false').lower() == 'true'
+    PROFILING_HEADER = os.environ.get('PROFILING_HEADER') or 'X-Profile'
+    PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE') or 0.0)  # 0 到 1
+    PROFILING_MAX_FILES = int(os.environ.get('PROFILING_MAX_FILES') or 100)
     
     # 安全配置
     RATE_LIMITING_ENABLED = os.environ.get('RATE_LIMITING_ENABLED', 'true').lower() == 'true'
     MAX_SUBMISSIONS_PER_MINUTE = int(os.environ.get('MAX_SUBMISSIONS_PER_MINUTE') or 30)
+    RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND') or 'memory'  # memory or redis
     
     # Flag配置
     FLAG_PREFIX = os.environ.get('FLAG_PREFIX') or 'CTF'
     FLAG_FORMAT = os.environ.get('FLAG_FORMAT') or 'static'  # static or dynamic
     FLAG_CASE_SENSITIVE = os.environ.get('FLAG_CASE_SENSITIVE', 'false').lower() == 'true'
+    DYNAMIC_FLAG_SECRET = os.environ.get('DYNAMIC_FLAG_SECRET')  # 为空时使用 SECRET_KEY
+    DYNAMIC_FLAG_INDEX_REFRESH = int(os.environ.get('DYNAMIC_FLAG_INDEX_REFRESH') or 60)  # seconds
     
     # 积分配置
     SCORING_SYSTEM = os.environ.get('SCORING_SYSTEM') or 'dynamic'  # static or dynamic
     BASE_POINTS = int(os.environ.get('BASE_POINTS') or 1000)
     BLOOD_BONUS_ENABLED = os.environ.get('BLOOD_BONUS_ENABLED', 'true').lower() == 'true'
     
+    # 动态分数后台调度配置（多进程部署时只有一个工作进程执行）
+    SCORE_SCHEDULER_ENABLED = os.environ.get('SCORE_SCHEDULER_ENABLED', 'false').lower() == 'true'
+    SCORE_SCHEDULER_INTERVAL = int(os.environ.get('SCORE_SCHEDULER_INTERVAL') or 60)  # seconds
+    
+    # 错误提交写后缓冲配置
+    SUBMISSION_BUFFER_ENABLED = os.environ.get('SUBMISSION_BUFFER_ENABLED', 'false').lower() == 'true'
+    SUBMISSION_BUFFER_SIZE = int(os.environ.get('SUBMISSION_BUFFER_SIZE') or 500)
+    SUBMISSION_BUFFER_MAX_LAG = float(os.environ.get('SUBMISSION_BUFFER_MAX_LAG') or 1.0)  # seconds
+    SUBMISSION_BUFFER_LIMIT = int(os.environ.get('SUBMISSION_BUFFER_LIMIT') or 10000)  # 队列上限，满时同步写入
+    
+    # 提交统计计数配置（全局计数分片数，减少热点行争用）
+    SUBMISSION_COUNTER_SHARDS = int(os.environ.get('SUBMISSION_COUNTER_SHARDS') or 8)
+    
+    # 排行榜配置
+    LEADERBOARD_CACHE_ENABLED = os.environ.get('LEADERBOARD_CACHE_ENABLED', 'true').lower() == 'true'
+    LEADERBOARD_SYNC_INTERVAL = int(os.environ.get('LEADERBOARD_SYNC_INTERVAL') or 30)  # seconds
+    
+    # 密码哈希工作池配置（登录高峰时排队超过上限直接返回 503）
+    PASSWORD_HASH_POOL_ENABLED = os.environ.get('PASSWORD_HASH_POOL_ENABLED', 'true').lower() == 'true'
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or 0)  # 0 表示 CPU 核数的一半
+    PASSWORD_HASH_QUEUE_LIMIT = int(os.environ.get('PASSWORD_HASH_QUEUE_LIMIT') or 32)
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT') or 5.0)  # seconds
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD')  # 如 pbkdf2:sha256:260000，为空时使用 werkzeug 默认值且不重新哈希
+    
+    # 用户身份缓存配置（token_required 命中缓存时不查询数据库）
+    IDENTITY_CACHE_ENABLED = os.environ.get('IDENTITY_CACHE_ENABLED', 'true').lower() == 'true'
+    IDENTITY_CACHE_TTL = int(os.environ.get('IDENTITY_CACHE_TTL') or 30)  # seconds
+    IDENTITY_CACHE_SIZE = int(os.environ.get('IDENTITY_CACHE_SIZE') or 10000)
+    
+    # 题目目录缓存配置
+    CHALLENGE_CATALOG_ENABLED = os.environ.get('CHALLENGE_CATALOG_ENABLED', 'true').lower() == 'true'
+    CHALLENGE_CATALOG_TTL = int(os.environ.get('CHALLENGE_CATALOG_TTL') or 30)  # seconds
+    
     # 比赛配置
     DEFAULT_CONTEST_DURATION = int(os.environ.get('DEFAULT_CONTEST_DURATION') or 24)  # hours
     
@@ -17,7 +17,7 @@ class User(UserMixin, db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(255), nullable=False)
     is_admin = db.Column(db.Boolean, default=False)
-    score = db.Column(db.Integer, default=0)
+    score = db.Column(db.Integer, default=0, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_login = db.Column(db.DateTime)
     is_active = db.Column(db.Boolean, default=True)
@@ -43,6 +43,25 @@ class User(UserMixin, db.Model):
         ).all()
         return [id[0] for id in solved_challenge_ids]
     
+    def get_challenge_progress(self):
+        """
+        一次查询获取用户已解决和已尝试的题目
+        
+        Returns:
+            tuple: (已解决题目ID集合, 已尝试题目ID集合)
+        """
+        from sqlalchemy import func, case
+        rows = db.session.query(
+            Submission.challenge_id,
+            func.max(case((Submission.is_correct == True, 1), else_=0))
+        ).filter(
+            Submission.user_id == self.id
+        ).group_by(Submission.challenge_id).all()
+        
+        solved = {challenge_id for challenge_id, is_solved in rows if is_solved}
+        attempted = {challenge_id for challenge_id, _ in rows}
+        return solved, attempted
+    
     def to_dict(self):
         """转换为字典（用于API响应）"""
         return {
@@ -93,14 +112,18 @@ class Challenge(db.Model):
     description = db.Column(db.Text, nullable=False)
     flag = db.Column(db.Text, nullable=False)
     points = db.Column(db.Integer, nullable=False, default=100)
+    base_points = db.Column(db.Integer)  # 初始分数，动态计分以此为基础
     difficulty = db.Column(db.Enum('easy', 'medium', 'hard', 'expert'), nullable=False, default='medium')
     category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False)
     creator_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, default=1)  # 设置默认管理员ID
     
     # 题目元数据
     solved_count = db.Column(db.Integer, default=0)
+    solve_sequence = db.Column(db.Integer, nullable=False, default=0)  # 已分配的最大解题顺序，删除解题记录后不回退
     first_blood_user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     is_hidden = db.Column(db.Boolean, default=False)
+    is_dynamic_flag = db.Column(db.Boolean, default=False)  # 每个用户的Flag由HMAC派生
+    is_regex_flag = db.Column(db.Boolean, default=False)  # Flag为正则表达式，按整体匹配校验
     hints = db.Column(db.Text)  # JSON格式存储提示
     
     # 文件附件
@@ -144,6 +167,8 @@ class Challenge(db.Model):
             'solved_count': self.solved_count,
             'first_blood_user_id': self.first_blood_user_id,
             'is_hidden': self.is_hidden,
+            'is_dynamic_flag': self.is_dynamic_flag,
+            'is_regex_flag': self.is_regex_flag,
             'hints': self.get_hints(),
             'attachment_filename': self.attachment_filename,
             'attachment_url': self.attachment_url,
@@ -191,6 +216,152 @@ class Submission(db.Model):
     def __repr__(self):
         return f'<Submission {self.user_id} -> {self.challenge_id} : {self.is_correct}>'
 
+class Solve(db.Model):
+    """解题记录模型（每个用户每道题只有一条，由唯一约束保证）"""
+    
+    __tablename__ = 'solves'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'challenge_id', name='uq_solves_user_challenge'),
+        db.Index('ix_solves_challenge_position', 'challenge_id', 'position'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    challenge_id = db.Column(db.Integer, db.ForeignKey('challenges.id'), nullable=False, index=True)
+    submission_id = db.Column(db.Integer, db.ForeignKey('submissions.id'))
+    solved_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    position = db.Column(db.Integer)  # 该题的第几个解题者（1/2/3 为一血/二血/三血）
+    bonus = db.Column(db.Integer, nullable=False, default=0)  # 获得的血量奖励分数
+    
+    # 关系
+    submission = db.relationship('Submission', foreign_keys=[submission_id])
+    
+    @staticmethod
+    def needs_backfill():
+        """
+        是否需要补全解题记录（已有正确提交但解题记录为空，如刚升级的旧数据库）
+        
+        Returns:
+            bool
+        """
+        if db.session.query(Solve.id).first() is not None:
+            return False
+        return db.session.query(Submission.id).filter(Submission.is_correct == True).first() is not None
+    
+    @staticmethod
+    def backfill():
+        """
+        根据已有的正确提交补全解题记录
+        
+        Returns:
+            int: 新增的解题记录数
+        """
+        from sqlalchemy import func
+        existing = set(db.session.query(Solve.user_id, Solve.challenge_id).all())
+        
+        first_solves = db.session.query(
+            Submission.user_id,
+            Submission.challenge_id,
+            func.min(Submission.id),
+            func.min(Submission.submitted_at)
+        ).filter(
+            Submission.is_correct == True
+        ).group_by(Submission.user_id, Submission.challenge_id).all()
+        
+        created = 0
+        for user_id, challenge_id, submission_id, solved_at in first_solves:
+            if (user_id, challenge_id) in existing:
+                continue
+            db.session.add(Solve(
+                user_id=user_id,
+                challenge_id=challenge_id,
+                submission_id=submission_id,
+                solved_at=solved_at
+            ))
+            created += 1
+        
+        Solve.backfill_positions()
+        db.session.flush()
+        Solve.sync_sequences()
+        
+        return created
+    
+    @staticmethod
+    def backfill_positions():
+        """
+        为缺少解题顺序的题目按解题时间补全 position（不补发奖励分数）
+        
+        Returns:
+            int: 更新的解题记录数
+        """
+        db.session.flush()
+        
+        challenge_ids = [row[0] for row in db.session.query(Solve.challenge_id)
+                         .filter(Solve.position.is_(None)).distinct().all()]
+        
+        updated = 0
+        for challenge_id in challenge_ids:
+            solves = Solve.query.filter_by(challenge_id=challenge_id)\
+                .order_by(Solve.solved_at, Solve.id).all()
+            for position, solve in enumerate(solves, start=1):
+                if solve.position != position:
+                    solve.position = position
+                    updated += 1
+        
+        return updated
+    
+    @staticmethod
+    def sync_sequences(conn=None):
+        """
+        将 challenges.solve_sequence 提升到不小于该题已有的最大解题顺序
+        
+        Args:
+            conn: 数据库连接，为空时使用当前会话
+        
+        Returns:
+            int: 更新的题目数
+        """
+        from sqlalchemy import func, select
+        challenges = Challenge.__table__
+        max_position = select(func.coalesce(func.max(Solve.position), 0))\
+            .where(Solve.challenge_id == challenges.c.id)\
+            .scalar_subquery()
+        
+        result = (conn or db.session).execute(
+            challenges.update()
+            .where(func.coalesce(challenges.c.solve_sequence, 0) < max_position)
+            .values(solve_sequence=max_position, updated_at=challenges.c.updated_at)
+        )
+        return result.rowcount
+    
+    def __repr__(self):
+        return f'<Solve {self.user_id} -> {self.challenge_id}>'
+
+class SubmissionCounter(db.Model):
+    """提交计数（正数 scope_id 为用户ID，负数为全局计数的分片，0 为已重建的标记）"""
+    
+    __tablename__ = 'submission_counters'
+    
+    scope_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    correct = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<SubmissionCounter {self.scope_id}: {self.correct}/{self.total}>'
+
+class SubmissionHourlyCounter(db.Model):
+    """按小时分桶的全局提交计数"""
+    
+    __tablename__ = 'submission_hourly_counters'
+    
+    hour = db.Column(db.DateTime, primary_key=True)
+    shard = db.Column(db.Integer, primary_key=True, autoincrement=False, default=0)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    correct = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<SubmissionHourlyCounter {self.hour}#{self.shard}: {self.correct}/{self.total}>'
+
 
 class SystemLog(db.Model):
     """系统日志模型"""
@@ -226,14 +397,106 @@ class SystemLog(db.Model):
     def __repr__(self):
         return f'<SystemLog {self.level} - {self.module}>'
 
+def upgrade_schema():
+    """
+    升级已有数据库的表结构
+
+    db.create_all() 只创建不存在的表，不会修改已有的表。此函数先创建新增的表，
+    再对比模型和数据库，为已有的表执行 ALTER TABLE ADD COLUMN 补充新增的列
+    （带默认值），并创建缺少的索引（已有相同列的索引时跳过），最后补全新增列的
+    数据（challenges.base_points 取当前分数，challenges.solve_sequence 取已有的
+    最大解题顺序），并在解题记录为空时根据正确提交补全、新建提交计数表时从提交
+    记录重建计数。可重复执行。
+
+    Returns:
+        list: 执行的 DDL 语句
+    """
+    from sqlalchemy import inspect, literal
+
+    engine = db.engine
+    dialect = engine.dialect
+    quote = dialect.identifier_preparer.quote
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    statements = [
+        f'CREATE TABLE {table.name}'
+        for table in db.metadata.sorted_tables if table.name not in existing_tables
+    ]
+    db.create_all()
+
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in columns:
+                    continue
+
+                ddl = (f'ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} '
+                       f'{column.type.compile(dialect=dialect)}')
+                if column.default is not None and column.default.is_scalar:
+                    default = literal(column.default.arg, column.type).compile(
+                        dialect=dialect, compile_kwargs={'literal_binds': True}
+                    )
+                    ddl += f' DEFAULT {default}'
+                    if not column.nullable:
+                        ddl += ' NOT NULL'
+
+                conn.exec_driver_sql(ddl)
+                statements.append(ddl)
+
+            indexed = {
+                tuple(index['column_names'])
+                for index in inspector.get_indexes(table.name) + inspector.get_unique_constraints(table.name)
+            }
+            for index in table.indexes:
+                if tuple(column.name for column in index.columns) in indexed:
+                    continue
+                index.create(bind=conn)
+                statements.append(f'CREATE INDEX {index.name} ON {table.name} '
+                                  f'({", ".join(column.name for column in index.columns)})')
+
+        # 动态计分的初始分数：已有题目取当前分数
+        challenges = Challenge.__table__
+        result = conn.execute(
+            challenges.update()
+            .where(challenges.c.base_points.is_(None))
+            .values(base_points=challenges.c.points, updated_at=challenges.c.updated_at)
+        )
+        if result.rowcount:
+            statements.append(f'UPDATE challenges SET base_points = points WHERE base_points IS NULL -- {result.rowcount} rows')
+
+        # 解题顺序计数：不小于已有解题记录的最大顺序
+        synced = Solve.sync_sequences(conn)
+        if synced:
+            statements.append(f'UPDATE challenges SET solve_sequence = MAX(solves.position) -- {synced} rows')
+
+    # 解题记录：新建的或为空的 solves 表根据正确提交补全，否则重新计分会把分数清零
+    if Solve.needs_backfill():
+        created = Solve.backfill()
+        db.session.commit()
+        statements.append(f'INSERT INTO solves SELECT ... FROM submissions WHERE is_correct -- {created} rows')
+
+    # 提交计数：新建的计数表从提交记录重建，之后由提交事务增量维护
+    if {'submission_counters', 'submission_hourly_counters'} - existing_tables:
+        from utils.submission_stats import rebuild_submission_counters
+        rebuild_submission_counters()
+        statements.append('INSERT INTO submission_counters SELECT ... FROM submissions GROUP BY user_id')
+
+    return statements
+
 # 初始化数据库
 def init_db(app):
     """初始化数据库"""
-    db.init_app(app)
+    # create_app 已注册过扩展时不能重复注册
+    if 'sqlalchemy' not in app.extensions:
+        db.init_app(app)
     
     with app.app_context():
-        # 创建所有表
-        db.create_all()
+        # 创建所有表，并为已有的表补充新增的列和索引
+        upgrade_schema()
         
         # 创建默认分类
         default_categories = [
@@ -274,5 +537,15 @@ def init_db(app):
                 print(f"将用户 {admin_username} 设置为管理员...")
                 admin_user.is_admin = True
         
+        # 为已有的正确提交补全解题记录
+        created = Solve.backfill()
+        if created:
+            print(f"补全解题记录 {created} 条")
+        
         db.session.commit()
+        
+        # 根据已有提交记录初始化提交统计计数
+        from utils.submission_stats import rebuild_submission_counters
+        rebuild_submission_counters()
+        
         print("数据库初始化完成!")
\ No newline at end of file
@@ -1,8 +1,15 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, send_file, stream_with_context
 from functools import wraps
-from models import db, User, Challenge, Submission, Category
+from models import db, User, Challenge, Submission, Category, Solve
 from sqlalchemy import func
-from utils.auth import token_required
+from sqlalchemy.orm import joinedload
+from utils.auth import token_required, identity_cache
+from utils.leaderboard import leaderboard_index
+from utils.flag import get_user_dynamic_flag
+from utils.submission_stats import remove_submissions
+from utils.submission_buffer import submission_buffer
+from utils.score_scheduler import score_scheduler
+from utils.profiler import request_profiler
 import datetime
 
 admin_bp = Blueprint('admin', __name__)
@@ -111,6 +118,9 @@ def update_user(current_user, user_id):
         
         db.session.commit()
         
+        leaderboard_index.update_user(user)
+        identity_cache.invalidate(user.id)
+        
         return jsonify({'message': 'User updated successfully!'}), 200
         
     except Exception as e:
@@ -128,12 +138,18 @@ def delete_user(current_user, user_id):
         if user.id == current_user.id:
             return jsonify({'message': 'Cannot delete your own account!'}), 400
         
-        # Delete user's submissions
+        # Delete user's solves and submissions
+        submission_buffer.discard(user_id=user_id)
+        remove_submissions(user_id=user_id)
+        Solve.query.filter_by(user_id=user_id).delete()
         Submission.query.filter_by(user_id=user_id).delete()
         
         db.session.delete(user)
         db.session.commit()
         
+        leaderboard_index.remove_user(user_id)
+        identity_cache.invalidate(user_id)
+        
         return jsonify({'message': 'User deleted successfully!'}), 200
         
     except Exception as e:
@@ -148,7 +164,11 @@ def get_all_submissions(current_user):
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 50, type=int)
         
-        submissions = Submission.query.order_by(Submission.submitted_at.desc())\
+        # 预加载用户名和题目标题，避免逐条查询
+        submissions = Submission.query.options(
+            joinedload(Submission.user).load_only(User.username),
+            joinedload(Submission.challenge).load_only(Challenge.title)
+        ).order_by(Submission.submitted_at.desc())\
             .paginate(page=page, per_page=per_page, error_out=False)
         
         submission_list = []
@@ -176,6 +196,26 @@ def get_all_submissions(current_user):
         current_app.logger.error(f"获取提交记录失败: {str(e)}")
         return jsonify({'message': '获取提交记录失败'}), 500
 
+@admin_bp.route('/challenges/<int:challenge_id>/dynamic-flag/<int:user_id>', methods=['GET'])
+@admin_required
+def get_dynamic_flag(current_user, challenge_id, user_id):
+    try:
+        challenge = Challenge.query.get_or_404(challenge_id)
+        user = User.query.get_or_404(user_id)
+        
+        if not challenge.is_dynamic_flag:
+            return jsonify({'message': 'Challenge does not use dynamic flags!'}), 400
+        
+        return jsonify({
+            'challenge_id': challenge.id,
+            'user_id': user.id,
+            'flag': get_user_dynamic_flag(challenge.id, user.id)
+        }), 200
+        
+    except Exception as e:
+        current_app.logger.error(f"获取动态Flag失败: {str(e)}")
+        return jsonify({'message': '获取动态Flag失败'}), 500
+
 @admin_bp.route('/categories', methods=['POST'])
 @admin_required
 def create_category(current_user):
@@ -273,31 +313,89 @@ def create_backup(current_user):
 def update_scores(current_user):
     try:
         from utils.scoring import ScoringSystem
-        ScoringSystem.update_challenge_scores()
+        stats = ScoringSystem.update_challenge_scores()
         
-        return jsonify({'message': 'Scores updated successfully!'}), 200
+        return jsonify({
+            'message': 'Scores updated successfully!',
+            'stats': stats
+        }), 200
         
+    except RuntimeError as e:
+        return jsonify({'message': str(e)}), 409
     except Exception as e:
         current_app.logger.error(f"更新分数失败: {str(e)}")
         return jsonify({'message': '更新分数失败'}), 500
 
+@admin_bp.route('/identity-cache', methods=['GET'])
+@admin_required
+def get_identity_cache(current_user):
+    return jsonify({'identity_cache': identity_cache.stats()}), 200
+
+@admin_bp.route('/score-scheduler', methods=['GET'])
+@admin_required
+def get_score_scheduler(current_user):
+    return jsonify({'scheduler': score_scheduler.stats()}), 200
+
+@admin_bp.route('/profiles', methods=['GET'])
+@admin_required
+def get_profiles(current_user):
+    return jsonify({
+        'enabled': request_profiler.enabled,
+        'profiles': request_profiler.list_profiles()
+    }), 200
+
+@admin_bp.route('/profiles/<profile_id>', methods=['GET'])
+@admin_required
+def get_profile(current_user, profile_id):
+    try:
+        profile = request_profiler.get_profile(
+            profile_id,
+            sort=request.args.get('sort'),
+            limit=request.args.get('limit', type=int)
+        )
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    if profile is None:
+        return jsonify({'message': 'Profile not found!'}), 404
+    
+    return jsonify({'profile': profile}), 200
+
+@admin_bp.route('/profiles/<profile_id>/download', methods=['GET'])
+@admin_required
+def download_profile(current_user, profile_id):
+    path = request_profiler.profile_file(profile_id)
+    if path is None:
+        return jsonify({'message': 'Profile not found!'}), 404
+    
+    return send_file(path, as_attachment=True, download_name=f'{profile_id}.prof')
+
+@admin_bp.route('/profiles/<profile_id>', methods=['DELETE'])
+@admin_required
+def delete_profile(current_user, profile_id):
+    if not request_profiler.delete(profile_id):
+        return jsonify({'message': 'Profile not found!'}), 404
+    
+    return jsonify({'message': 'Profile deleted successfully!'}), 200
+
 @admin_bp.route('/export-data', methods=['GET'])
 @admin_required
 def export_data(current_user):
-    try:
-        import json
-        from datetime import datetime
-        
-        data = {
-            'export_time': datetime.utcnow().isoformat(),
-            'users': [user.to_dict() for user in User.query.all()],
-            'challenges': [challenge.to_dict() for challenge in Challenge.query.all()],
-            'submissions': [submission.to_dict() for submission in Submission.query.limit(1000).all()],
-            'categories': [category.to_dict() for category in Category.query.all()]
-        }
-        
-        return jsonify(data), 200
-        
-    except Exception as e:
-        current_app.logger.error(f"导出数据失败: {str(e)}")
-        return jsonify({'message': '导出数据失败'}), 500
\ No newline at end of file
+    from utils.export import iter_export_bytes
+    
+    compress = request.args.get('gzip', 'false').lower() in ('1', 'true')
+    filename = f"ctf_export_{datetime.datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.ndjson" + ('.gz' if compress else '')
+    
+    def generate():
+        # 响应头已发送，出错时只能记录日志并中断输出
+        try:
+            yield from iter_export_bytes(compress=compress)
+        except Exception as e:
+            current_app.logger.error(f"导出数据失败: {str(e)}")
+            raise
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/gzip' if compress else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
\ No newline at end of file
@@ -1,32 +1,24 @@
 from flask import Blueprint, request, jsonify, session
-from werkzeug.security import check_password_hash, generate_password_hash
 import jwt
 import datetime
-from functools import wraps
 from models import db, User
 from config import Config
+from utils.leaderboard import leaderboard_index
+from utils.scoring import ScoringSystem
+from utils.flag import dynamic_flag_index
+from utils.auth import token_required, identity_cache
+from utils.password_pool import password_pool, PasswordPoolBusy
 
 auth_bp = Blueprint('auth', __name__)
 
-def token_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = request.headers.get('Authorization')
-        
-        if not token:
-            return jsonify({'message': 'Token is missing!'}), 401
-        
-        try:
-            if token.startswith('Bearer '):
-                token = token[7:]
-            data = jwt.decode(token, Config.SECRET_KEY, algorithms=['HS256'])
-            current_user = User.query.get(data['user_id'])
-        except:
-            return jsonify({'message': 'Token is invalid!'}), 401
-        
-        return f(current_user, *args, **kwargs)
-    
-    return decorated
+def _busy_response(error):
+    """密码哈希工作池繁忙时快速返回 503"""
+    response = jsonify({
+        'message': 'Server is busy, please try again later.',
+        'retry_after': error.retry_after
+    })
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
 
 @auth_bp.route('/register', methods=['POST'])
 def register():
@@ -43,8 +35,8 @@ def register():
         if User.query.filter_by(email=data['email']).first():
             return jsonify({'message': 'Email already exists!'}), 400
         
-        # Create new user
-        hashed_password = generate_password_hash(data['password'])
+        # Create new user (hash in the bounded worker pool)
+        hashed_password = password_pool.hash_password(data['password'])
         new_user = User(
             username=data['username'],
             email=data['email'],
@@ -55,11 +47,16 @@ def register():
         db.session.add(new_user)
         db.session.commit()
         
+        leaderboard_index.update_user(new_user)
+        dynamic_flag_index.add_user(new_user.id)
+        
         return jsonify({
             'message': 'User registered successfully!',
             'user_id': new_user.id
         }), 201
         
+    except PasswordPoolBusy as e:
+        return _busy_response(e)
     except Exception as e:
         return jsonify({'message': str(e)}), 500
 
@@ -73,9 +70,14 @@ def login():
         
         user = User.query.filter_by(username=data['username']).first()
         
-        if not user or not check_password_hash(user.password_hash, data['password']):
+        if not user or not password_pool.check_password(user, data['password']):
             return jsonify({'message': 'Invalid credentials!'}), 401
         
+        # Password hash was upgraded to PASSWORD_HASH_METHOD
+        if db.session.is_modified(user):
+            db.session.commit()
+            identity_cache.invalidate(user.id)
+        
         # Generate JWT token
         token = jwt.encode({
             'user_id': user.id,
@@ -94,6 +96,8 @@ def login():
             }
         }), 200
         
+    except PasswordPoolBusy as e:
+        return _busy_response(e)
     except Exception as e:
         return jsonify({'message': str(e)}), 500
 
@@ -107,7 +111,8 @@ def get_profile(current_user):
             'email': current_user.email,
             'is_admin': current_user.is_admin,
             'created_at': current_user.created_at.isoformat(),
-            'score': current_user.score
+            'score': current_user.score,
+            'rank': ScoringSystem.get_user_rank(current_user.id)
         }
     }), 200
 
@@ -125,11 +130,14 @@ def update_profile(current_user):
             current_user.email = data['email']
         
         if data.get('password'):
-            current_user.password_hash = generate_password_hash(data['password'])
+            current_user.password_hash = password_pool.hash_password(data['password'])
         
         db.session.commit()
+        identity_cache.invalidate(current_user.id)
         
         return jsonify({'message': 'Profile updated successfully!'}), 200
         
+    except PasswordPoolBusy as e:
+        return _busy_response(e)
     except Exception as e:
         return jsonify({'message': str(e)}), 500
\ No newline at end of file
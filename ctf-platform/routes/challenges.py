@@ -3,10 +3,19 @@ from functools import wraps
 import os
 import datetime
 import json
-from models import db, Challenge, Submission, User, Category
-from utils.auth import token_required
-from utils.flag import verify_flag
+from sqlalchemy.orm import joinedload
+from models import db, Challenge, Submission, User, Category, Solve
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from utils.auth import token_required, identity_cache
+from utils.flag import get_flag_verifier, invalidate_flag_verifier, verify_dynamic_flag, dynamic_flag_index, compile_flag_pattern
+from utils.log import log_security_event
 from utils.scoring import ScoringSystem
+from utils.leaderboard import leaderboard_index
+from utils.catalog import challenge_catalog
+from utils.ratelimit import submission_limiter
+from utils.submission_buffer import submission_buffer
+from utils.submission_stats import record_submission, remove_submissions
 from config import Config
 
 challenges_bp = Blueprint('challenges', __name__)
@@ -24,20 +33,28 @@ def admin_required(f):
 @token_required
 def get_challenges(current_user):
     try:
-        # 管理员可以看到所有题目，包括隐藏的
-        if current_user.is_admin:
-            challenges = Challenge.query.all()
-        else:
-            challenges = Challenge.query.filter_by(is_hidden=False).all()
+        # 一次查询获取用户已解决和已尝试的题目
+        solved_ids, attempted_ids = current_user.get_challenge_progress()
+        
+        # 在缓存的题目目录上叠加用户相关字段
+        if challenge_catalog.enabled:
+            body = challenge_catalog.render(
+                include_hidden=current_user.is_admin,
+                solved_ids=solved_ids,
+                attempted_ids=attempted_ids,
+                show_all_hints=current_user.is_admin
+            )
+            return current_app.response_class(body, mimetype='application/json'), 200
+        
+        # 管理员可以看到所有题目，包括隐藏的（预加载分类，避免逐题查询）
+        query = Challenge.query.options(joinedload(Challenge.category))
+        if not current_user.is_admin:
+            query = query.filter_by(is_hidden=False)
+        challenges = query.all()
         
         result = []
         for challenge in challenges:
-            # Check if user has solved this challenge
-            solved = Submission.query.filter_by(
-                user_id=current_user.id,
-                challenge_id=challenge.id,
-                is_correct=True
-            ).first() is not None
+            solved = challenge.id in solved_ids
             
             challenge_data = {
                 'id': challenge.id,
@@ -54,7 +71,7 @@ def get_challenges(current_user):
             }
             
             # Only show hints to users who have attempted the challenge or are admins
-            if current_user.is_admin or Submission.query.filter_by(user_id=current_user.id, challenge_id=challenge.id).first():
+            if current_user.is_admin or challenge.id in attempted_ids:
                 try:
                     challenge_data['hints'] = json.loads(challenge.hints) if challenge.hints else []
                 except:
@@ -112,6 +129,7 @@ def get_challenge(current_user, challenge_id):
         return jsonify({'message': '获取题目详情失败'}), 500
 
 @challenges_bp.route('/challenges/<int:challenge_id>/submit', methods=['POST'])
+@submission_limiter.limit_submissions
 @token_required
 def submit_flag(current_user, challenge_id):
     try:
@@ -136,7 +154,33 @@ def submit_flag(current_user, challenge_id):
             return jsonify({'message': 'You have already solved this challenge!'}), 400
         
         # Verify flag
-        is_correct = verify_flag(data['flag'], challenge.flag)
+        if challenge.is_dynamic_flag:
+            is_correct = verify_dynamic_flag(challenge_id, current_user.id, data['flag'])
+            
+            if not is_correct:
+                # 提交的是其他用户的动态Flag，记录Flag共享
+                owner_id = dynamic_flag_index.lookup(challenge_id, data['flag'])
+                if owner_id is not None and owner_id != current_user.id:
+                    log_security_event(
+                        'FLAG_SHARING',
+                        current_user.id,
+                        f'Challenge:{challenge_id} - Submitted the dynamic flag of User:{owner_id}',
+                        severity='WARNING'
+                    )
+        else:
+            is_correct = get_flag_verifier(challenge).verify(data['flag'])
+        
+        # 错误提交写入缓冲队列，由后台批量写入；队列已满时同步写入
+        if not is_correct and submission_buffer.enabled and submission_buffer.add(
+            user_id=current_user.id,
+            challenge_id=challenge_id,
+            flag_submitted=data['flag'],
+            submitted_at=datetime.datetime.utcnow()
+        ):
+            return jsonify({
+                'message': 'Incorrect flag!',
+                'is_correct': False
+            }), 200
         
         submission = Submission(
             user_id=current_user.id,
@@ -148,21 +192,81 @@ def submit_flag(current_user, challenge_id):
         
         db.session.add(submission)
         
+        first_blood = False
+        position = None
+        bonus = 0
+        points = challenge.points
+        
         if is_correct:
-            # Update user score and challenge solved count
-            current_user.score += challenge.points
-            challenge.solved_count += 1
+            # 解题记录的唯一约束保证并发提交时每个用户每道题只计分一次
+            solve = Solve(
+                user_id=current_user.id,
+                challenge_id=challenge_id,
+                submission=submission,
+                solved_at=submission.submitted_at
+            )
+            db.session.add(solve)
+            try:
+                db.session.flush()
+            except IntegrityError:
+                db.session.rollback()
+                return jsonify({'message': 'You have already solved this challenge!'}), 400
+            
+            # Increment the solve counters atomically; the row lock held until commit
+            # makes the sequence read back this solve's position. solve_sequence never
+            # goes down (unlike solved_count, which score recalculation resets to the
+            # current number of solves), so deleted solves cannot hand out a position twice
+            Challenge.query.filter_by(id=challenge_id).update(
+                {
+                    Challenge.solved_count: func.coalesce(Challenge.solved_count, 0) + 1,
+                    Challenge.solve_sequence: func.coalesce(Challenge.solve_sequence, 0) + 1
+                },
+                synchronize_session=False
+            )
+            position = db.session.query(Challenge.solve_sequence)\
+                .filter(Challenge.id == challenge_id).scalar()
+            
+            if current_app.config.get('BLOOD_BONUS_ENABLED', False):
+                bonus = ScoringSystem.calculate_blood_bonus(position)
+            solve.position = position
+            solve.bonus = bonus
+            points += bonus
             
-            # Update first blood if this is the first solution
-            if challenge.solved_count == 1:
-                challenge.first_blood_user_id = current_user.id
+            # Update user score (atomic SQL increment)
+            User.query.filter_by(id=current_user.id).update(
+                {User.score: func.coalesce(User.score, 0) + points},
+                synchronize_session=False
+            )
+            
+            # Claim first blood with a conditional update
+            if position == 1:
+                first_blood = Challenge.query.filter(
+                    Challenge.id == challenge_id,
+                    Challenge.first_blood_user_id.is_(None)
+                ).update(
+                    {Challenge.first_blood_user_id: current_user.id},
+                    synchronize_session=False
+                ) == 1
+        
+        # 在同一事务中更新提交计数
+        record_submission(current_user.id, is_correct, submission.submitted_at)
         
         db.session.commit()
         
-        return jsonify({
+        if is_correct:
+            leaderboard_index.record_solve(current_user.id, points, submission.submitted_at)
+            identity_cache.invalidate(current_user.id)
+        
+        response = {
             'message': 'Correct flag!' if is_correct else 'Incorrect flag!',
             'is_correct': is_correct
-        }), 200
+        }
+        if is_correct:
+            response['first_blood'] = first_blood
+            response['position'] = position
+            response['bonus'] = bonus
+        
+        return jsonify(response), 200
         
     except Exception as e:
         db.session.rollback()
@@ -179,8 +283,11 @@ def create_challenge(current_user):
             
         data = request.get_json()
         
-        # 详细的字段验证
+        # 详细的字段验证（动态Flag题目无需填写Flag）
+        is_dynamic_flag = bool(data.get('is_dynamic_flag', False))
         required_fields = ['title', 'description', 'flag', 'points', 'difficulty', 'category_id']
+        if is_dynamic_flag:
+            required_fields.remove('flag')
         missing_fields = [field for field in required_fields if field not in data or not data[field]]
         
         if missing_fields:
@@ -205,6 +312,14 @@ def create_challenge(current_user):
         if data['difficulty'] not in valid_difficulties:
             return jsonify({'message': '难度值无效'}), 400
         
+        # 正则Flag在保存时编译校验
+        is_regex_flag = bool(data.get('is_regex_flag', False))
+        if is_regex_flag and not is_dynamic_flag:
+            try:
+                compile_flag_pattern(data['flag'].strip(), current_app.config.get('FLAG_CASE_SENSITIVE', False))
+            except ValueError as e:
+                return jsonify({'message': f'正则Flag无效: {str(e)}'}), 400
+        
         # 处理提示字段
         hints = data.get('hints', [])
         if hints and isinstance(hints, list):
@@ -216,13 +331,16 @@ def create_challenge(current_user):
         challenge = Challenge(
             title=data['title'].strip(),
             description=data['description'].strip(),
-            flag=data['flag'].strip(),
+            flag=(data.get('flag') or '').strip(),
             points=points,
+            base_points=points,
             difficulty=data['difficulty'],
             category_id=category_id,
             creator_id=current_user.id,
             hints=hints_json,
             is_hidden=bool(data.get('is_hidden', False)),
+            is_dynamic_flag=is_dynamic_flag,
+            is_regex_flag=is_regex_flag,
             created_at=datetime.datetime.utcnow(),
             updated_at=datetime.datetime.utcnow()
         )
@@ -230,6 +348,8 @@ def create_challenge(current_user):
         db.session.add(challenge)
         db.session.commit()
         
+        challenge_catalog.bump_version()
+        
         # 返回完整的成功响应
         response_data = {
             'message': '题目创建成功!',
@@ -272,12 +392,24 @@ def update_challenge(current_user, challenge_id):
         challenge = Challenge.query.get_or_404(challenge_id)
         data = request.get_json()
         
-        updatable_fields = ['title', 'description', 'flag', 'points', 'difficulty', 'category_id', 'is_hidden']
+        updatable_fields = ['title', 'description', 'flag', 'points', 'difficulty', 'category_id', 'is_hidden', 'is_dynamic_flag', 'is_regex_flag']
         
         for field in updatable_fields:
             if field in data:
                 setattr(challenge, field, data[field])
         
+        # 正则Flag在保存时编译校验
+        if challenge.is_regex_flag and not challenge.is_dynamic_flag and ('flag' in data or 'is_regex_flag' in data):
+            try:
+                compile_flag_pattern((challenge.flag or '').strip(), current_app.config.get('FLAG_CASE_SENSITIVE', False))
+            except ValueError as e:
+                db.session.rollback()
+                return jsonify({'message': f'正则Flag无效: {str(e)}'}), 400
+        
+        # 管理员修改分数时同时更新动态计分的基础分数
+        if 'points' in data:
+            challenge.base_points = data['points']
+        
         # 特殊处理 hints 字段
         if 'hints' in data:
             hints = data['hints']
@@ -290,6 +422,12 @@ def update_challenge(current_user, challenge_id):
         
         db.session.commit()
         
+        challenge_catalog.bump_version()
+        if 'flag' in data or 'is_regex_flag' in data:
+            invalidate_flag_verifier(challenge_id)
+        if 'is_dynamic_flag' in data:
+            dynamic_flag_index.remove_challenge(challenge_id)
+        
         return jsonify({'message': 'Challenge updated successfully!'}), 200
         
     except Exception as e:
@@ -303,12 +441,22 @@ def delete_challenge(current_user, challenge_id):
     try:
         challenge = Challenge.query.get_or_404(challenge_id)
         
-        # Delete related submissions first
+        # Delete related solves and submissions first
+        submission_buffer.discard(challenge_id=challenge_id)
+        remove_submissions(challenge_id=challenge_id)
+        Solve.query.filter_by(challenge_id=challenge_id).delete()
         Submission.query.filter_by(challenge_id=challenge_id).delete()
         
         db.session.delete(challenge)
         db.session.commit()
         
+        challenge_catalog.bump_version()
+        invalidate_flag_verifier(challenge_id)
+        dynamic_flag_index.remove_challenge(challenge_id)
+        
+        # 删除题目会改变用户的解题数，重建排行榜索引
+        leaderboard_index.invalidate()
+        
         return jsonify({'message': 'Challenge deleted successfully!'}), 200
         
     except Exception as e:
@@ -1,7 +1,9 @@
 from flask import Blueprint, request, jsonify
-from models import db, User, Submission, Challenge
+from models import db, User, Submission, Challenge, Solve
 from sqlalchemy import func, desc, case, text
 from utils.auth import token_required
+from utils.leaderboard import leaderboard_index
+from utils.scoring import ScoringSystem
 import datetime
 
 leaderboard_bp = Blueprint('leaderboard', __name__)
@@ -13,6 +15,28 @@ def get_leaderboard(current_user):
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 50, type=int)
         
+        # 优先从内存排行榜索引读取
+        if leaderboard_index.enabled:
+            result = leaderboard_index.get_page(page, per_page)
+            
+            leaderboard = []
+            for entry in result['items']:
+                leaderboard.append({
+                    'rank': entry['rank'],
+                    'user_id': entry['user_id'],
+                    'username': entry['username'],
+                    'score': entry['score'],
+                    'solved_count': entry['solved_count'],
+                    'last_solve': entry['last_solve'].isoformat() if entry['last_solve'] else None
+                })
+            
+            return jsonify({
+                'leaderboard': leaderboard,
+                'total': result['total'],
+                'pages': result['pages'],
+                'current_page': page
+            }), 200
+        
         # 全球排行榜查询
         user_scores = db.session.query(
             User.id,
@@ -23,7 +47,7 @@ def get_leaderboard(current_user):
         ).outerjoin(Submission, User.id == Submission.user_id)\
          .filter(User.is_admin == False)\
          .group_by(User.id)\
-         .order_by(desc(User.score), desc('solved_count'))\
+         .order_by(desc(User.score), desc('solved_count'), User.id)\
          .paginate(page=page, per_page=per_page, error_out=False)
         
         leaderboard = []
@@ -53,59 +77,101 @@ def get_leaderboard(current_user):
         traceback.print_exc()
         return jsonify({'message': f'Internal server error: {str(e)}'}), 500
 
+@leaderboard_bp.route('/leaderboard/rank', methods=['GET'], defaults={'user_id': None})
+@leaderboard_bp.route('/leaderboard/rank/<int:user_id>', methods=['GET'])
+@token_required
+def get_user_rank(current_user, user_id):
+    try:
+        if user_id is None:
+            user_id = current_user.id
+        
+        rank = ScoringSystem.get_user_rank(user_id)
+        
+        if rank is None:
+            return jsonify({'message': 'User is not ranked!'}), 404
+        
+        return jsonify({
+            'user_id': user_id,
+            'rank': rank
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
+@leaderboard_bp.route('/leaderboard/around', methods=['GET'])
+@token_required
+def get_leaderboard_around(current_user):
+    try:
+        user_id = request.args.get('user_id', current_user.id, type=int)
+        count = min(max(request.args.get('n', 5, type=int), 0), 50)
+        
+        neighbours = ScoringSystem.get_users_around(user_id, count)
+        
+        if not neighbours:
+            return jsonify({'message': 'User is not ranked!'}), 404
+        
+        return jsonify({
+            'user_id': user_id,
+            'leaderboard': neighbours
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'message': str(e)}), 500
+
 @leaderboard_bp.route('/leaderboard/category/<int:category_id>', methods=['GET'])
 @token_required
 def get_category_leaderboard(current_user, category_id):
     try:
-        # 简化的分类排行榜实现
-        # 获取所有非管理员用户
-        users = User.query.filter_by(is_admin=False).all()
-        
-        leaderboard_data = []
-        
-        for user in users:
-            # 获取用户在该分类下解决的所有题目（去重）
-            solved_challenges_query = db.session.query(
-                Submission.challenge_id
-            ).join(
-                Challenge, Submission.challenge_id == Challenge.id
-            ).filter(
-                Submission.user_id == user.id,
-                Submission.is_correct == True,
-                Challenge.category_id == category_id
-            ).distinct()
-            
-            solved_challenges = solved_challenges_query.all()
-            solved_count = len(solved_challenges)
-            
-            if solved_count > 0:
-                # 计算该分类下的总分
-                total_score = 0
-                for challenge_tuple in solved_challenges:
-                    challenge_id = challenge_tuple[0]
-                    challenge = Challenge.query.get(challenge_id)
-                    if challenge:
-                        total_score += challenge.points
-                
-                leaderboard_data.append({
-                    'user_id': user.id,
-                    'username': user.username,
-                    'score': total_score,
-                    'solved_count': solved_count
-                })
+        page = request.args.get('page', 1, type=int)
+        per_page = request.args.get('per_page', 50, type=int)
+        
+        # 该分类下每个用户解决的题目（去重）
+        solved = db.session.query(
+            Submission.user_id.label('user_id'),
+            Submission.challenge_id.label('challenge_id')
+        ).join(
+            Challenge, Submission.challenge_id == Challenge.id
+        ).filter(
+            Submission.is_correct == True,
+            Challenge.category_id == category_id
+        ).distinct().subquery()
         
-        # 按分数排序
-        leaderboard_data.sort(key=lambda x: x['score'], reverse=True)
+        # 一次分组查询得到所有用户的分类总分和解题数
+        category_scores = db.session.query(
+            User.id,
+            User.username,
+            func.sum(Challenge.points).label('score'),
+            func.count(solved.c.challenge_id).label('solved_count')
+        ).join(
+            solved, solved.c.user_id == User.id
+        ).join(
+            Challenge, Challenge.id == solved.c.challenge_id
+        ).filter(
+            User.is_admin == False
+        ).group_by(
+            User.id, User.username
+        ).order_by(
+            desc('score'), User.id
+        ).paginate(page=page, per_page=per_page, error_out=False)
         
-        # 添加排名
         leaderboard = []
-        for i, user_data in enumerate(leaderboard_data, start=1):
-            user_data['rank'] = i
-            leaderboard.append(user_data)
+        rank_offset = (category_scores.page - 1) * category_scores.per_page
+        
+        for i, user in enumerate(category_scores.items, start=1):
+            leaderboard.append({
+                'rank': rank_offset + i,
+                'user_id': user.id,
+                'username': user.username,
+                'score': int(user.score or 0),
+                'solved_count': user.solved_count
+            })
         
         return jsonify({
             'category_id': category_id,
-            'leaderboard': leaderboard
+            'leaderboard': leaderboard,
+            'total': category_scores.total,
+            'pages': category_scores.pages,
+            'current_page': page
         }), 200
         
     except Exception as e:
@@ -118,27 +184,31 @@ def get_category_leaderboard(current_user, category_id):
 @token_required
 def get_challenge_leaderboard(current_user, challenge_id):
     try:
-        # 题目排行榜：显示解决该题目的用户（按解决时间排序）
-        submissions = db.session.query(
-            Submission.user_id,
+        # 题目排行榜：显示解决该题目的用户（按解题时记录的顺序，直接走 (challenge_id, position) 索引）
+        solves = db.session.query(
+            Solve.user_id,
             User.username,
-            Submission.submitted_at
+            Solve.solved_at,
+            Solve.position,
+            Solve.bonus
         ).join(
-            User, Submission.user_id == User.id
+            User, Solve.user_id == User.id
         ).filter(
-            Submission.challenge_id == challenge_id,
-            Submission.is_correct == True
+            Solve.challenge_id == challenge_id
         ).order_by(
-            Submission.submitted_at
+            Solve.position
         ).all()
         
         leaderboard = []
-        for i, submission in enumerate(submissions, start=1):
+        for i, solve in enumerate(solves, start=1):
             user_data = {
                 'rank': i,
-                'user_id': submission.user_id,
-                'username': submission.username,
-                'solved_at': submission.submitted_at.isoformat()
+                'user_id': solve.user_id,
+                'username': solve.username,
+                'solved_at': solve.solved_at.isoformat() if solve.solved_at else None,
+                'position': solve.position,
+                'blood': solve.position if solve.position and solve.position <= 3 else None,
+                'bonus': solve.bonus or 0
             }
             leaderboard.append(user_data)
         
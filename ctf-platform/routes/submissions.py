@@ -1,8 +1,9 @@
 from flask import Blueprint, request, jsonify
+from sqlalchemy.orm import joinedload
 from models import db, Submission, User, Challenge
 from utils.auth import token_required
+from utils.submission_stats import read_submission_stats
 from config import Config
-import datetime
 
 submissions_bp = Blueprint('submissions', __name__)
 
@@ -15,8 +16,11 @@ def get_submissions(current_user):
         challenge_id = request.args.get('challenge_id', type=int)
         user_id = request.args.get('user_id', type=int)
         
-        # Base query
-        query = Submission.query
+        # Base query（预加载用户名和题目标题，避免逐条查询）
+        query = Submission.query.options(
+            joinedload(Submission.user).load_only(User.username),
+            joinedload(Submission.challenge).load_only(Challenge.title)
+        )
         
         # Filter by challenge if provided
         if challenge_id:
@@ -82,6 +86,7 @@ def get_user_submissions(current_user, user_id):
         per_page = request.args.get('per_page', 20, type=int)
         
         submissions = Submission.query.filter_by(user_id=user_id)\
+            .options(joinedload(Submission.challenge).load_only(Challenge.title))\
             .order_by(Submission.submitted_at.desc())\
             .paginate(page=page, per_page=per_page, error_out=False)
         
@@ -118,7 +123,8 @@ def get_challenge_submissions(current_user, challenge_id):
         per_page = request.args.get('per_page', 20, type=int)
         
         # Base query
-        query = Submission.query.filter_by(challenge_id=challenge_id)
+        query = Submission.query.filter_by(challenge_id=challenge_id)\
+            .options(joinedload(Submission.user).load_only(User.username))
         
         # Non-admin users can only see their own submissions for a challenge
         if not current_user.is_admin:
@@ -156,21 +162,13 @@ def get_challenge_submissions(current_user, challenge_id):
 @token_required
 def get_submission_stats(current_user):
     try:
-        # Total submissions
-        total_submissions = Submission.query.count()
-        
-        # Correct submissions
-        correct_submissions = Submission.query.filter_by(is_correct=True).count()
-        
-        # User's submissions
-        user_total = Submission.query.filter_by(user_id=current_user.id).count()
-        user_correct = Submission.query.filter_by(user_id=current_user.id, is_correct=True).count()
+        # 读取维护的计数，不再逐次扫描提交表
+        stats = read_submission_stats(current_user.id)
         
-        # Recent activity (last 7 days)
-        week_ago = datetime.datetime.utcnow() - datetime.timedelta(days=7)
-        recent_submissions = Submission.query.filter(
-            Submission.submitted_at >= week_ago
-        ).count()
+        total_submissions = stats['total_submissions']
+        correct_submissions = stats['correct_submissions']
+        user_total = stats['user_total']
+        user_correct = stats['user_correct']
         
         return jsonify({
             'stats': {
@@ -180,7 +178,7 @@ def get_submission_stats(current_user):
                 'user_total': user_total,
                 'user_correct': user_correct,
                 'user_accuracy': (user_correct / user_total * 100) if user_total > 0 else 0,
-                'recent_submissions': recent_submissions
+                'recent_submissions': stats['recent_submissions']
             }
         }), 200
         
@@ -0,0 +1,226 @@
+import os
+import time
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from models import db, User, Category, Challenge, Submission, Solve
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow 为可选依赖，仅列式导出需要
+    pa = None
+
+# 每批读取的行数
+DEFAULT_BATCH_SIZE = 50000
+
+# 支持的输出格式及文件扩展名
+FORMATS = {'parquet': 'parquet', 'arrow': 'arrow'}
+
+class _PartitionedWriter:
+    """按天分区写入列式文件：<目录>/<数据集>/date=YYYY-MM-DD/part-0.<扩展名>"""
+
+    def __init__(self, base_dir, name, schema, file_format, compression):
+        self.base_dir = os.path.join(base_dir, name)
+        self.schema = schema
+        self.file_format = file_format
+        self.compression = compression
+        self._day = None
+        self._writer = None
+        self._sink = None
+        self.rows = 0
+        self.files = 0
+
+    def write(self, day, columns):
+        """写入同一天的一批列数据（数据按时间有序，每天只打开一次文件）"""
+        if day != self._day:
+            self.close()
+            partition = os.path.join(self.base_dir, f'date={day.isoformat()}')
+            os.makedirs(partition, exist_ok=True)
+            path = os.path.join(partition, f'part-0.{FORMATS[self.file_format]}')
+
+            if self.file_format == 'parquet':
+                self._writer = pq.ParquetWriter(path, self.schema, compression=self.compression)
+            else:
+                self._sink = pa.OSFile(path, 'wb')
+                options = pa.ipc.IpcWriteOptions(compression=self.compression)
+                self._writer = pa.ipc.new_file(self._sink, self.schema, options=options)
+            self._day = day
+            self.files += 1
+
+        table = pa.Table.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema
+        )
+        self._writer.write_table(table)
+        self.rows += table.num_rows
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._sink is not None:
+            self._sink.close()
+            self._sink = None
+        self._day = None
+
+def _write_by_day(writer, rows, time_index, columns=None):
+    """
+    按时间列把一批有序行切分到各天的分区
+
+    Args:
+        writer: _PartitionedWriter
+        rows: 按时间升序的行
+        time_index: 时间列的下标
+        columns: 已转置的列数据，为空时从 rows 转置
+    """
+    if columns is None:
+        columns = list(zip(*rows))
+    times = columns[time_index]
+
+    start = 0
+    while start < len(times):
+        day = times[start].date()
+        end = bisect_left(times, datetime.combine(day, datetime.min.time()) + timedelta(days=1), lo=start)
+        writer.write(day, [column[start:end] for column in columns])
+        start = end
+
+def export_analytics(output_dir, file_format='parquet', batch_size=DEFAULT_BATCH_SIZE,
+                     include_flags=False, compression='zstd'):
+    """
+    将提交记录、解题记录和得分事件导出为按天分区的列式文件
+
+    每个数据源只读取一次：提交记录按 (submitted_at, id) 以服务端游标按批读取，
+    解题记录按 (solved_at, id) 读取并在同一循环中累计每个用户的得分，生成
+    得分事件（每次解题的得分和解题后的累计总分，题目当前分数加血量奖励）。
+    数据按时间有序，每个分区文件只打开一次，内存占用与批大小成正比。
+
+    输出目录结构（hive 分区，可用 pyarrow.dataset / pandas / polars / DuckDB 直接读取）：
+        submissions/date=YYYY-MM-DD/part-0.parquet
+        solves/date=YYYY-MM-DD/part-0.parquet
+        score_events/date=YYYY-MM-DD/part-0.parquet
+
+    Args:
+        output_dir: 输出目录，不存在时创建，已存在时必须为空
+        file_format: parquet 或 arrow（Arrow IPC 文件）
+        batch_size: 游标每批读取的行数
+        include_flags: 是否导出提交的Flag内容
+        compression: 压缩算法（parquet: zstd/snappy/gzip 等；arrow: zstd/lz4）
+
+    Returns:
+        dict: 各数据集的行数、文件数和耗时
+
+    Raises:
+        RuntimeError: 未安装 pyarrow
+        ValueError: 格式无效或输出目录非空
+    """
+    if pa is None:
+        raise RuntimeError('pyarrow package is required for columnar export')
+    if file_format not in FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(FORMATS)}")
+    if os.path.isdir(output_dir) and os.listdir(output_dir):
+        raise ValueError(f'Output directory is not empty: {output_dir}')
+
+    start_time = time.perf_counter()
+    connection = db.session.connection()
+    options = {'stream_results': True, 'max_row_buffer': batch_size}
+
+    submission_fields = [
+        pa.field('id', pa.int64()),
+        pa.field('submitted_at', pa.timestamp('us')),
+        pa.field('user_id', pa.int32()),
+        pa.field('username', pa.string()),
+        pa.field('challenge_id', pa.int32()),
+        pa.field('challenge_title', pa.string()),
+        pa.field('category', pa.string()),
+        pa.field('is_correct', pa.bool_())
+    ]
+    submission_columns = [
+        Submission.id, Submission.submitted_at, Submission.user_id, User.username,
+        Submission.challenge_id, Challenge.title, Category.name, Submission.is_correct
+    ]
+    if include_flags:
+        submission_fields.append(pa.field('flag_submitted', pa.string()))
+        submission_columns.append(Submission.flag_submitted)
+
+    submissions = _PartitionedWriter(output_dir, 'submissions', pa.schema(submission_fields), file_format, compression)
+    solves = _PartitionedWriter(output_dir, 'solves', pa.schema([
+        pa.field('id', pa.int64()),
+        pa.field('solved_at', pa.timestamp('us')),
+        pa.field('user_id', pa.int32()),
+        pa.field('username', pa.string()),
+        pa.field('challenge_id', pa.int32()),
+        pa.field('challenge_title', pa.string()),
+        pa.field('category', pa.string()),
+        pa.field('position', pa.int32()),
+        pa.field('bonus', pa.int32())
+    ]), file_format, compression)
+    score_events = _PartitionedWriter(output_dir, 'score_events', pa.schema([
+        pa.field('time', pa.timestamp('us')),
+        pa.field('user_id', pa.int32()),
+        pa.field('challenge_id', pa.int32()),
+        pa.field('points', pa.int32()),
+        pa.field('score', pa.int64())
+    ]), file_format, compression)
+
+    try:
+        # 1. 提交记录
+        statement = select(*submission_columns).outerjoin(
+            User, User.id == Submission.user_id
+        ).outerjoin(
+            Challenge, Challenge.id == Submission.challenge_id
+        ).outerjoin(
+            Category, Category.id == Challenge.category_id
+        ).where(
+            Submission.submitted_at.isnot(None)
+        ).order_by(Submission.submitted_at, Submission.id)
+
+        for rows in connection.execute(statement, execution_options=options).partitions(batch_size):
+            _write_by_day(submissions, rows, 1)
+
+        # 2. 解题记录和得分事件
+        points = dict(db.session.query(Challenge.id, Challenge.points).all())
+        user_scores = {}
+
+        statement = select(
+            Solve.id, Solve.solved_at, Solve.user_id, User.username, Solve.challenge_id,
+            Challenge.title, Category.name, Solve.position, Solve.bonus
+        ).join(
+            User, User.id == Solve.user_id
+        ).join(
+            Challenge, Challenge.id == Solve.challenge_id
+        ).outerjoin(
+            Category, Category.id == Challenge.category_id
+        ).where(
+            Solve.solved_at.isnot(None)
+        ).order_by(Solve.solved_at, Solve.id)
+
+        for rows in connection.execute(statement, execution_options=options).partitions(batch_size):
+            columns = list(zip(*rows))
+            _write_by_day(solves, rows, 1, columns)
+
+            event_points = []
+            event_scores = []
+            for user_id, challenge_id, bonus in zip(columns[2], columns[4], columns[8]):
+                earned = (points.get(challenge_id) or 0) + (bonus or 0)
+                score = user_scores.get(user_id, 0) + earned
+                user_scores[user_id] = score
+                event_points.append(earned)
+                event_scores.append(score)
+
+            _write_by_day(score_events, None, 0, [columns[1], columns[2], columns[4], event_points, event_scores])
+    finally:
+        for writer in (submissions, solves, score_events):
+            writer.close()
+
+    db.session.rollback()
+
+    return {
+        'format': file_format,
+        'submissions': submissions.rows,
+        'solves': solves.rows,
+        'score_events': score_events.rows,
+        'files': submissions.files + solves.files + score_events.files,
+        'duration_ms': round((time.perf_counter() - start_time) * 1000, 2)
+    }
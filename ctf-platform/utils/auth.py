@@ -1,8 +1,164 @@
 import jwt
 import datetime
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
 from flask import request, jsonify, current_app
-from models import User
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+from models import db, User
+
+class IdentityCache:
+    """
+    用户身份缓存
+
+    缓存已验证 token 的解码结果（跳过 jwt.decode）和按用户ID缓存的用户列数据
+    （跳过 User.query.get）。缓存的是与会话分离的 User 副本，命中时通过
+    db.session.merge(load=False) 放入当前请求的会话，不访问数据库，路由中
+    仍可像普通查询结果一样修改并提交。
+
+    条目在 IDENTITY_CACHE_TTL 秒后过期，数量超过 IDENTITY_CACHE_SIZE 时淘汰
+    最久未使用的条目。修改用户（管理员更新/删除、更新个人资料、解题加分、
+    重算分数）时需显式失效；其他工作进程的缓存在 TTL 内过期。
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._users = OrderedDict()     # user_id -> (过期时间, 分离的 User 副本)
+        self._tokens = OrderedDict()    # token -> (过期时间, 解码后的数据)
+        self.enabled = True
+        self.ttl = 30
+        self.max_size = 10000
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.token_hits = 0
+        self.token_misses = 0
+        self.invalidations = 0
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('IDENTITY_CACHE_ENABLED', True)
+        self.ttl = app.config.get('IDENTITY_CACHE_TTL', 30)
+        self.max_size = app.config.get('IDENTITY_CACHE_SIZE', 10000)
+
+    def _put(self, entries, key, value, expires_at):
+        entries[key] = (expires_at, value)
+        entries.move_to_end(key)
+        while len(entries) > self.max_size:
+            entries.popitem(last=False)
+
+    def _get(self, entries, key):
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del entries[key]
+            return None
+        entries.move_to_end(key)
+        return entry[1]
+
+    def decode_token(self, token):
+        """
+        解码并验证 token，已验证过且未过期的 token 直接返回缓存结果
+
+        Raises:
+            jwt.InvalidTokenError: token 无效或已过期
+        """
+        if not self.enabled:
+            return jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
+
+        with self._lock:
+            data = self._get(self._tokens, token)
+            if data is not None:
+                self.token_hits += 1
+                return data
+            self.token_misses += 1
+
+        data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
+
+        # 缓存时间不超过 token 本身的有效期
+        lifetime = self.ttl
+        if 'exp' in data:
+            lifetime = min(lifetime, data['exp'] - time.time())
+        if lifetime > 0:
+            with self._lock:
+                self._put(self._tokens, token, data, time.monotonic() + lifetime)
+
+        return data
+
+    def get_user(self, user_id):
+        """
+        获取用户，命中缓存时不访问数据库
+
+        Returns:
+            User: 属于当前会话的用户对象，不存在时返回 None
+        """
+        if not self.enabled:
+            return User.query.get(user_id)
+
+        with self._lock:
+            cached = self._get(self._users, user_id)
+            if cached is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if cached is not None:
+            return db.session.merge(cached, load=False)
+
+        user = User.query.get(user_id)
+        if user is not None:
+            with self._lock:
+                self._put(self._users, user_id, self._detached_copy(user), time.monotonic() + self.ttl)
+
+        return user
+
+    @staticmethod
+    def _detached_copy(user):
+        """复制用户的列数据，生成与会话分离的副本"""
+        copy = User()
+        for attr in inspect(User).column_attrs:
+            setattr(copy, attr.key, getattr(user, attr.key))
+        make_transient_to_detached(copy)
+        return copy
+
+    def invalidate(self, user_id):
+        """用户数据变化时调用"""
+        with self._lock:
+            self._users.pop(user_id, None)
+            self.invalidations += 1
+
+    def clear(self):
+        """批量修改用户（如重算分数）后清空用户缓存"""
+        with self._lock:
+            self._users.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        """缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            token_lookups = self.token_hits + self.token_misses
+            return {
+                'enabled': self.enabled,
+                'users': len(self._users),
+                'tokens': len(self._tokens),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'token_hits': self.token_hits,
+                'token_misses': self.token_misses,
+                'token_hit_rate': round(self.token_hits / token_lookups, 4) if token_lookups else None,
+                'invalidations': self.invalidations
+            }
+
+# 创建全局用户身份缓存实例
+identity_cache = IdentityCache()
 
 def token_required(f):
     """JWT token验证装饰器"""
@@ -17,9 +173,9 @@ def token_required(f):
             if token.startswith('Bearer '):
                 token = token[7:]
             
-            # 解码token
-            data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user = User.query.get(data['user_id'])
+            # 解码token（命中缓存时不访问数据库）
+            data = identity_cache.decode_token(token)
+            current_user = identity_cache.get_user(data['user_id'])
             
             if not current_user:
                 return jsonify({'message': 'User not found!'}), 401
@@ -61,7 +217,7 @@ def verify_token(token):
     try:
         if token.startswith('Bearer '):
             token = token[7:]
-        data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
+        data = identity_cache.decode_token(token)
         return data
     except jwt.ExpiredSignatureError:
         return None
@@ -77,7 +233,7 @@ def get_current_user():
     try:
         if token.startswith('Bearer '):
             token = token[7:]
-        data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-        return User.query.get(data['user_id'])
+        data = identity_cache.decode_token(token)
+        return identity_cache.get_user(data['user_id'])
     except:
         return None
\ No newline at end of file
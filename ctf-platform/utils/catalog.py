@@ -0,0 +1,139 @@
+import json
+import threading
+import time
+from sqlalchemy.orm import joinedload
+from models import db, Challenge
+
+class ChallengeCatalog:
+    """
+    题目目录缓存
+
+    题目的公共部分（标题、描述、分类名、难度、分数、提示）对所有用户相同，
+    在进程内预先序列化为 JSON 片段缓存。创建、修改、删除题目以及重新计算
+    分数时递增版本号使本进程的缓存失效；其他工作进程通过每次请求读取的
+    题目ID、可见性和分数发现新增、删除、隐藏和分数变化并立即重建，标题、
+    描述等其余字段的修改在 TTL 后可见。每次请求只需在缓存片段上拼接用户
+    相关字段（是否解决、提示可见性）和解题数。
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._version = 0
+        self._built_version = None
+        self._built_at = 0.0
+        self._entries = []
+        self.enabled = True
+        self.ttl = 30
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('CHALLENGE_CATALOG_ENABLED', True)
+        self.ttl = app.config.get('CHALLENGE_CATALOG_TTL', 30)
+
+    @property
+    def version(self):
+        return self._version
+
+    def bump_version(self):
+        """题目数据变化时调用，使缓存失效"""
+        with self._lock:
+            self._version += 1
+
+    def _build(self):
+        """从数据库构建预序列化的题目目录"""
+        challenges = Challenge.query.options(joinedload(Challenge.category))\
+            .order_by(Challenge.id).all()
+
+        entries = []
+        for challenge in challenges:
+            public_data = {
+                'id': challenge.id,
+                'title': challenge.title,
+                'description': challenge.description,
+                'category': challenge.category.name if challenge.category else 'General',
+                'category_id': challenge.category_id,
+                'difficulty': challenge.difficulty,
+                'points': challenge.points,
+                'is_hidden': challenge.is_hidden,
+                'created_at': challenge.created_at.isoformat() if challenge.created_at else None
+            }
+
+            entries.append({
+                'id': challenge.id,
+                'is_hidden': challenge.is_hidden,
+                'points': challenge.points,
+                # 去掉结尾的 '}'，以便追加用户相关字段
+                'prefix': json.dumps(public_data, ensure_ascii=False)[:-1],
+                'hints': json.dumps(challenge.get_hints(), ensure_ascii=False)
+            })
+
+        return entries
+
+    def get_entries(self):
+        """获取题目目录，版本变化或超过 TTL 时重建"""
+        version = self._version
+        if self._built_version == version and time.monotonic() - self._built_at < self.ttl:
+            return self._entries
+
+        entries = self._build()
+        with self._lock:
+            self._entries = entries
+            self._built_version = version
+            self._built_at = time.monotonic()
+
+        return entries
+
+    def render(self, include_hidden, solved_ids, attempted_ids, show_all_hints=False):
+        """
+        渲染题目列表 JSON
+
+        Args:
+            include_hidden: 是否包含隐藏题目
+            solved_ids: 用户已解决的题目ID集合
+            attempted_ids: 用户已尝试的题目ID集合
+            show_all_hints: 是否显示所有题目的提示（管理员）
+
+        Returns:
+            str: {"challenges": [...]} 格式的 JSON 字符串
+        """
+        entries = self.get_entries()
+
+        # 解题数随每次解题变化，单独读取；同时读取可见性和分数，与缓存不一致
+        # （其他工作进程修改了题目）时立即重建
+        rows = db.session.query(
+            Challenge.id,
+            Challenge.solved_count,
+            Challenge.is_hidden,
+            Challenge.points
+        ).all()
+        current = {challenge_id: (is_hidden, points) for challenge_id, _, is_hidden, points in rows}
+        if current != {entry['id']: (entry['is_hidden'], entry['points']) for entry in entries}:
+            self.bump_version()
+            entries = self.get_entries()
+
+        solved_counts = {challenge_id: solved_count for challenge_id, solved_count, _, _ in rows}
+
+        parts = []
+        for entry in entries:
+            challenge_id = entry['id']
+
+            # 跳过隐藏题目，以及已被其他进程删除的题目
+            if entry['is_hidden'] and not include_hidden:
+                continue
+            if challenge_id not in solved_counts:
+                continue
+
+            part = (
+                f"{entry['prefix']}, \"solved_count\": {int(solved_counts.get(challenge_id) or 0)}"
+                f", \"is_solved\": {'true' if challenge_id in solved_ids else 'false'}"
+            )
+            if show_all_hints or challenge_id in attempted_ids:
+                part += f", \"hints\": {entry['hints']}"
+            parts.append(part + '}')
+
+        return '{"challenges": [' + ', '.join(parts) + ']}'
+
+# 创建全局题目目录缓存实例
+challenge_catalog = ChallengeCatalog()
@@ -0,0 +1,142 @@
+import json
+import zlib
+from datetime import datetime
+from sqlalchemy import select
+from models import db, User, Category, Challenge, Submission
+
+# 每批读取和输出的行数
+DEFAULT_BATCH_SIZE = 5000
+
+# 导出格式版本，字段变化时递增
+EXPORT_VERSION = 1
+
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+_string = json.encoder.encode_basestring
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+def _hints(value):
+    if not value:
+        return []
+    try:
+        return json.loads(value)
+    except (ValueError, TypeError):
+        return []
+
+def _json_iso(value):
+    return 'null' if value is None else f'"{value.isoformat()}"'
+
+def _submission_line(r):
+    """提交记录行数最多，直接拼接 JSON 文本，不经过字典和通用编码器"""
+    return (
+        f'{{"type":"submission","id":{r[0]},"user_id":{r[1]},'
+        f'"username":{"null" if r[2] is None else _string(r[2])},'
+        f'"challenge_id":{r[3]},'
+        f'"challenge_title":{"null" if r[4] is None else _string(r[4])},'
+        f'"flag_submitted":{"null" if r[5] is None else _string(r[5])},'
+        f'"is_correct":{"true" if r[6] else "false"},'
+        f'"submitted_at":{_json_iso(r[7])}}}'
+    )
+
+def _sections():
+    """各类数据的 (类型, 查询, 行转换函数)，只查询需要的列"""
+    categories = select(
+        Category.id, Category.name, Category.description, Category.created_at
+    ).order_by(Category.id)
+
+    users = select(
+        User.id, User.username, User.email, User.is_admin, User.score,
+        User.created_at, User.last_login
+    ).order_by(User.id)
+
+    challenges = select(
+        Challenge.id, Challenge.title, Challenge.description, Challenge.points,
+        Challenge.difficulty, Challenge.category_id, Category.name, Challenge.solved_count,
+        Challenge.first_blood_user_id, Challenge.is_hidden, Challenge.is_dynamic_flag,
+        Challenge.hints, Challenge.attachment_filename, Challenge.attachment_url,
+        Challenge.created_at, Challenge.updated_at
+    ).outerjoin(Category, Category.id == Challenge.category_id).order_by(Challenge.id)
+
+    submissions = select(
+        Submission.id, Submission.user_id, User.username, Submission.challenge_id,
+        Challenge.title, Submission.flag_submitted, Submission.is_correct, Submission.submitted_at
+    ).outerjoin(
+        User, User.id == Submission.user_id
+    ).outerjoin(
+        Challenge, Challenge.id == Submission.challenge_id
+    ).order_by(Submission.id)
+
+    return [
+        ('category', categories, lambda r: _encode({
+            'type': 'category', 'id': r[0], 'name': r[1], 'description': r[2],
+            'created_at': _iso(r[3])
+        })),
+        ('user', users, lambda r: _encode({
+            'type': 'user', 'id': r[0], 'username': r[1], 'email': r[2], 'is_admin': r[3],
+            'score': r[4], 'created_at': _iso(r[5]), 'last_login': _iso(r[6])
+        })),
+        ('challenge', challenges, lambda r: _encode({
+            'type': 'challenge', 'id': r[0], 'title': r[1], 'description': r[2], 'points': r[3],
+            'difficulty': r[4], 'category_id': r[5], 'category_name': r[6], 'solved_count': r[7],
+            'first_blood_user_id': r[8], 'is_hidden': r[9], 'is_dynamic_flag': r[10],
+            'hints': _hints(r[11]), 'attachment_filename': r[12], 'attachment_url': r[13],
+            'created_at': _iso(r[14]), 'updated_at': _iso(r[15])
+        })),
+        ('submission', submissions, _submission_line)
+    ]
+
+def iter_export(batch_size=DEFAULT_BATCH_SIZE, counts=None):
+    """
+    以 NDJSON 流式导出分类、用户、题目和全部提交记录
+
+    第一行为 {"type": "export", ...} 头部，之后每行一条记录（type 字段区分
+    category/user/challenge/submission），最后一行为 {"type": "summary", ...}
+    各类记录数。每类数据以服务端游标（stream_results）按批读取，每批拼接成
+    一个文本块输出，内存占用与数据总量无关。所有查询在当前会话的同一事务中执行。
+
+    Args:
+        batch_size: 游标每批读取的行数，也是每个输出块的行数
+        counts: 可选字典，导出过程中写入各类记录数
+
+    Yields:
+        str: 由若干完整行组成的文本块
+    """
+    if counts is None:
+        counts = {}
+
+    yield _encode({
+        'type': 'export',
+        'version': EXPORT_VERSION,
+        'export_time': datetime.utcnow().isoformat()
+    }) + '\n'
+
+    connection = db.session.connection()
+    options = {'stream_results': True, 'max_row_buffer': batch_size}
+    for record_type, statement, convert in _sections():
+        counts[record_type] = 0
+        for rows in connection.execute(statement, execution_options=options).partitions(batch_size):
+            counts[record_type] += len(rows)
+            yield '\n'.join([convert(row) for row in rows]) + '\n'
+
+    yield _encode({'type': 'summary', 'counts': counts}) + '\n'
+
+def iter_export_bytes(compress=False, batch_size=DEFAULT_BATCH_SIZE, counts=None, level=6):
+    """
+    iter_export 的字节流版本，compress=True 时输出 gzip 格式
+
+    Yields:
+        bytes: UTF-8 编码（或 gzip 压缩）的数据块
+    """
+    chunks = iter_export(batch_size=batch_size, counts=counts)
+    if not compress:
+        for chunk in chunks:
+            yield chunk.encode('utf-8')
+        return
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 生成 gzip 头
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -1,5 +1,8 @@
 import hashlib
+import hmac
 import secrets
+import threading
+import time
 import string
 import re
 from flask import current_app
@@ -30,7 +33,132 @@ def generate_flag(prefix="CTF", format_type="static", length=32):
     else:
         raise ValueError(f"Unsupported flag format: {format_type}")
 
-def verify_flag(submitted_flag, correct_flag, case_sensitive=False, strict_format=True):
+def compile_flag_pattern(pattern, case_sensitive=False):
+    """
+    编译正则Flag
+    
+    Args:
+        pattern: 正则表达式
+        case_sensitive: 是否区分大小写
+    
+    Returns:
+        re.Pattern: 编译后的正则表达式
+    
+    Raises:
+        ValueError: 正则表达式为空或无效
+    """
+    if not pattern:
+        raise ValueError('Regex flag must not be empty')
+    
+    try:
+        return re.compile(pattern, 0 if case_sensitive else re.IGNORECASE)
+    except re.error as e:
+        raise ValueError(f'Invalid regex flag: {e}')
+
+class FlagVerifier:
+    """
+    预编译的Flag校验器
+    
+    构建时完成正确Flag的规范化（去空白、大小写、宽松模式去除空格），
+    校验时只需处理提交的Flag并做常数时间比较。is_regex 为 True 时正确Flag
+    为正则表达式，按整体匹配校验。
+    """
+    
+    _WHITESPACE_RE = re.compile(r'\s+')
+    
+    def __init__(self, correct_flag, case_sensitive=False, strict_format=True, is_regex=False):
+        self.case_sensitive = case_sensitive
+        self.strict_format = strict_format
+        self.pattern = None
+        self.canonical = None
+        
+        flag = (correct_flag or '').strip()
+        
+        if is_regex:
+            self.pattern = compile_flag_pattern(flag, case_sensitive)
+        elif flag:
+            self.canonical = self.normalize(flag).encode()
+    
+    def normalize(self, flag):
+        """按校验规则规范化Flag"""
+        flag = flag.strip()
+        
+        if not self.case_sensitive:
+            flag = flag.lower()
+        
+        # 宽松模式：去除空格等字符后匹配
+        if not self.strict_format:
+            flag = self._WHITESPACE_RE.sub('', flag)
+        
+        return flag
+    
+    def verify(self, submitted_flag):
+        """
+        验证提交的Flag
+        
+        Args:
+            submitted_flag: 用户提交的Flag
+        
+        Returns:
+            bool: Flag是否正确
+        """
+        if not submitted_flag:
+            return False
+        
+        if self.pattern is not None:
+            return self.pattern.fullmatch(submitted_flag.strip()) is not None
+        
+        if not self.canonical:
+            return False
+        
+        return hmac.compare_digest(self.normalize(submitted_flag).encode(), self.canonical)
+
+# 题目ID -> ((构建时的Flag, 是否正则), 校验器)
+_verifier_cache = {}
+_verifier_lock = threading.Lock()
+
+def get_flag_verifier(challenge):
+    """
+    获取题目的Flag校验器（按题目缓存）
+    
+    缓存命中时仍会确认存储的Flag未变化，其他工作进程修改Flag后也能自动重建。
+    
+    Args:
+        challenge: 题目对象
+    
+    Returns:
+        FlagVerifier: Flag校验器
+    """
+    key = (challenge.flag, bool(challenge.is_regex_flag))
+    cached = _verifier_cache.get(challenge.id)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    
+    verifier = FlagVerifier(
+        challenge.flag,
+        case_sensitive=current_app.config.get('FLAG_CASE_SENSITIVE', False),
+        is_regex=key[1]
+    )
+    
+    with _verifier_lock:
+        _verifier_cache[challenge.id] = (key, verifier)
+    
+    return verifier
+
+def invalidate_flag_verifier(challenge_id=None):
+    """
+    使Flag校验器缓存失效
+    
+    Args:
+        challenge_id: 题目ID，为 None 时清空全部缓存
+    """
+    with _verifier_lock:
+        if challenge_id is None:
+            _verifier_cache.clear()
+        else:
+            _verifier_cache.pop(challenge_id, None)
+
+def verify_flag(submitted_flag, correct_flag, case_sensitive=False, strict_format=True, is_regex=False):
     """
     验证Flag
     
@@ -39,6 +167,7 @@ def verify_flag(submitted_flag, correct_flag, case_sensitive=False, strict_forma
         correct_flag: 正确的Flag
         case_sensitive: 是否区分大小写
         strict_format: 是否严格验证格式
+        is_regex: 正确Flag是否为正则表达式
     
     Returns:
         bool: Flag是否正确
@@ -46,23 +175,8 @@ def verify_flag(submitted_flag, correct_flag, case_sensitive=False, strict_forma
     if not submitted_flag or not correct_flag:
         return False
     
-    # 预处理Flag
-    submitted = submitted_flag.strip()
-    correct = correct_flag.strip()
-    
-    if not case_sensitive:
-        submitted = submitted.lower()
-        correct = correct.lower()
-    
-    # 严格模式：完全匹配
-    if strict_format:
-        return submitted == correct
-    
-    # 宽松模式：去除空格等字符后匹配
-    else:
-        submitted_clean = re.sub(r'\s+', '', submitted)
-        correct_clean = re.sub(r'\s+', '', correct)
-        return submitted_clean == correct_clean
+    verifier = FlagVerifier(correct_flag, case_sensitive=case_sensitive, strict_format=strict_format, is_regex=is_regex)
+    return verifier.verify(submitted_flag)
 
 def hash_flag(flag, method='sha256'):
     """
@@ -114,7 +228,7 @@ def validate_flag_format(flag, expected_prefix="CTF"):
     
     return True
 
-def generate_dynamic_flag(challenge_id, user_id, secret_key):
+def generate_dynamic_flag(challenge_id, user_id, secret_key, prefix="CTF"):
     """
     生成动态Flag（基于题目ID和用户ID）
     
@@ -122,11 +236,11 @@ def generate_dynamic_flag(challenge_id, user_id, secret_key):
         challenge_id: 题目ID
         user_id: 用户ID
         secret_key: 密钥
+        prefix: Flag前缀
     
     Returns:
         str: 动态Flag
     """
-    import hmac
     message = f"{challenge_id}:{user_id}"
     signature = hmac.new(
         secret_key.encode(), 
@@ -134,4 +248,131 @@ def generate_dynamic_flag(challenge_id, user_id, secret_key):
         hashlib.sha256
     ).hexdigest()[:16]
     
-    return f"CTF{{{signature}}}"
\ No newline at end of file
+    return f"{prefix}{{{signature}}}"
+
+def get_user_dynamic_flag(challenge_id, user_id):
+    """
+    按当前配置生成用户在某道题上的动态Flag
+    
+    Args:
+        challenge_id: 题目ID
+        user_id: 用户ID
+    
+    Returns:
+        str: 动态Flag
+    """
+    config = current_app.config
+    return generate_dynamic_flag(
+        challenge_id,
+        user_id,
+        config.get('DYNAMIC_FLAG_SECRET') or config['SECRET_KEY'],
+        config.get('FLAG_PREFIX', 'CTF')
+    )
+
+def verify_dynamic_flag(challenge_id, user_id, submitted_flag):
+    """
+    验证动态Flag（校验时用 HMAC 现算用户的Flag，无需按用户存储）
+    
+    Args:
+        challenge_id: 题目ID
+        user_id: 用户ID
+        submitted_flag: 用户提交的Flag
+    
+    Returns:
+        bool: Flag是否正确
+    """
+    expected = get_user_dynamic_flag(challenge_id, user_id)
+    verifier = FlagVerifier(expected, case_sensitive=current_app.config.get('FLAG_CASE_SENSITIVE', False))
+    return verifier.verify(submitted_flag)
+
+class DynamicFlagIndex:
+    """
+    动态Flag反查索引
+    
+    为每道动态Flag题目预先计算所有用户的Flag，建立 Flag -> 用户ID 的映射，
+    提交错误时可直接查出该Flag属于哪个用户，用于检测Flag共享。
+    新注册用户会增量加入索引；另按固定间隔补充其他工作进程注册的用户。
+    """
+    
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._index = {}        # challenge_id -> {规范化的Flag: user_id}
+        self._user_ids = set()
+        self._max_user_id = 0    # 已从数据库加载到的最大用户ID
+        self._last_refresh = 0.0
+        self.refresh_interval = 60
+        
+        if app:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.refresh_interval = app.config.get('DYNAMIC_FLAG_INDEX_REFRESH', 60)
+    
+    @staticmethod
+    def _normalize(flag):
+        flag = flag.strip()
+        if not current_app.config.get('FLAG_CASE_SENSITIVE', False):
+            flag = flag.lower()
+        return flag
+    
+    def _refresh_users(self):
+        """加载上次刷新之后注册的用户"""
+        from models import User
+        
+        new_ids = [row[0] for row in User.query.with_entities(User.id)
+                   .filter(User.id > self._max_user_id).order_by(User.id).all()]
+        
+        with self._lock:
+            self._last_refresh = time.monotonic()
+            for user_id in new_ids:
+                self._add_user_locked(user_id)
+            if new_ids:
+                self._max_user_id = max(self._max_user_id, new_ids[-1])
+    
+    def _add_user_locked(self, user_id):
+        if user_id in self._user_ids:
+            return
+        self._user_ids.add(user_id)
+        for challenge_id, flags in self._index.items():
+            flags[self._normalize(get_user_dynamic_flag(challenge_id, user_id))] = user_id
+    
+    def add_user(self, user_id):
+        """新用户注册后加入索引"""
+        with self._lock:
+            self._add_user_locked(user_id)
+    
+    def remove_challenge(self, challenge_id):
+        """题目删除或关闭动态Flag后移除索引"""
+        with self._lock:
+            self._index.pop(challenge_id, None)
+    
+    def lookup(self, challenge_id, submitted_flag):
+        """
+        查询提交的Flag属于哪个用户
+        
+        Args:
+            challenge_id: 题目ID
+            submitted_flag: 提交的Flag
+        
+        Returns:
+            int: Flag所属用户ID，不属于任何用户时返回 None
+        """
+        if not submitted_flag:
+            return None
+        
+        if time.monotonic() - self._last_refresh >= self.refresh_interval:
+            self._refresh_users()
+        
+        with self._lock:
+            flags = self._index.get(challenge_id)
+            if flags is None:
+                flags = {
+                    self._normalize(get_user_dynamic_flag(challenge_id, user_id)): user_id
+                    for user_id in self._user_ids
+                }
+                self._index[challenge_id] = flags
+            
+            return flags.get(self._normalize(submitted_flag))
+
+# 创建全局动态Flag索引实例
+dynamic_flag_index = DynamicFlagIndex()
\ No newline at end of file
@@ -0,0 +1,259 @@
+import bisect
+import math
+import threading
+import time
+from sqlalchemy import func, case
+from models import db, User, Submission
+
+class LeaderboardIndex:
+    """
+    内存排行榜索引
+
+    启动后首次访问时从数据库构建一次有序排名结构，之后由解题、
+    管理员修改分数等操作增量维护。分页、总数和排名均直接从内存返回，
+    并按固定间隔与数据库做一次轻量一致性校验（用户数、总分、正确提交数），
+    不一致时重建索引。
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.RLock()
+        self._entries = {}      # user_id -> 排行榜条目
+        self._keys = []         # 有序键列表: (-score, -solved_count, user_id)
+        self._loaded = False
+        self._last_check = 0.0
+        self.enabled = True
+        self.sync_interval = 30
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('LEADERBOARD_CACHE_ENABLED', True)
+        self.sync_interval = app.config.get('LEADERBOARD_SYNC_INTERVAL', 30)
+
+    @staticmethod
+    def _sort_key(entry):
+        """排序键：分数降序、解题数降序、用户ID升序"""
+        return (-entry['score'], -entry['solved_count'], entry['user_id'])
+
+    def _insert(self, entry):
+        self._entries[entry['user_id']] = entry
+        bisect.insort(self._keys, self._sort_key(entry))
+
+    def _remove(self, user_id):
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return None
+        key = self._sort_key(entry)
+        index = bisect.bisect_left(self._keys, key)
+        if index < len(self._keys) and self._keys[index] == key:
+            del self._keys[index]
+        return entry
+
+    def _signature(self):
+        """内存中的一致性校验签名"""
+        return (
+            len(self._entries),
+            sum(entry['score'] for entry in self._entries.values()),
+            sum(entry['solved_count'] for entry in self._entries.values())
+        )
+
+    @staticmethod
+    def _db_signature():
+        """数据库中的一致性校验签名"""
+        user_count, score_sum = db.session.query(
+            func.count(User.id),
+            func.coalesce(func.sum(User.score), 0)
+        ).filter(User.is_admin == False).one()
+
+        solved_sum = db.session.query(func.count(Submission.id))\
+            .join(User, User.id == Submission.user_id)\
+            .filter(User.is_admin == False, Submission.is_correct == True)\
+            .scalar()
+
+        return (user_count, int(score_sum or 0), solved_sum or 0)
+
+    def rebuild(self):
+        """从数据库全量重建排行榜索引"""
+        rows = db.session.query(
+            User.id,
+            User.username,
+            User.score,
+            func.count(case((Submission.is_correct == True, Submission.id))).label('solved_count'),
+            func.max(case((Submission.is_correct == True, Submission.submitted_at))).label('last_solve')
+        ).outerjoin(Submission, User.id == Submission.user_id)\
+         .filter(User.is_admin == False)\
+         .group_by(User.id)\
+         .all()
+
+        entries = {}
+        for row in rows:
+            entries[row.id] = {
+                'user_id': row.id,
+                'username': row.username,
+                'score': row.score or 0,
+                'solved_count': row.solved_count or 0,
+                'last_solve': row.last_solve
+            }
+
+        with self._lock:
+            self._entries = entries
+            self._keys = sorted(self._sort_key(entry) for entry in entries.values())
+            self._loaded = True
+            self._last_check = time.monotonic()
+
+    def ensure_fresh(self):
+        """首次使用时构建索引，超过校验间隔时与数据库核对"""
+        if not self._loaded:
+            self.rebuild()
+            return
+
+        if time.monotonic() - self._last_check < self.sync_interval:
+            return
+
+        db_signature = self._db_signature()
+        with self._lock:
+            in_sync = self._signature() == db_signature
+            self._last_check = time.monotonic()
+
+        if not in_sync:
+            self.rebuild()
+
+    def invalidate(self):
+        """标记索引失效，下次访问时重建"""
+        with self._lock:
+            self._loaded = False
+
+    def record_solve(self, user_id, points, solved_at):
+        """
+        记录一次正确提交
+
+        Args:
+            user_id: 用户ID
+            points: 获得的分数
+            solved_at: 解题时间
+        """
+        with self._lock:
+            if not self._loaded:
+                return
+
+            entry = self._remove(user_id)
+            if entry is None:
+                # 索引中没有该用户（例如其他进程新注册的用户），等待重建
+                self._loaded = False
+                return
+
+            entry['score'] += points
+            entry['solved_count'] += 1
+            if not entry['last_solve'] or (solved_at and solved_at > entry['last_solve']):
+                entry['last_solve'] = solved_at
+            self._insert(entry)
+
+    def update_user(self, user):
+        """
+        同步用户的用户名、分数和管理员状态
+
+        Args:
+            user: 用户对象
+        """
+        with self._lock:
+            if not self._loaded:
+                return
+
+            entry = self._remove(user.id)
+            if user.is_admin:
+                return
+
+            if entry is None:
+                entry = {
+                    'user_id': user.id,
+                    'solved_count': 0,
+                    'last_solve': None
+                }
+            entry['username'] = user.username
+            entry['score'] = user.score or 0
+            self._insert(entry)
+
+    def remove_user(self, user_id):
+        """从排行榜中移除用户"""
+        with self._lock:
+            if self._loaded:
+                self._remove(user_id)
+
+    def get_rank(self, user_id):
+        """
+        获取用户排名（二分查找，O(log n)）
+
+        Args:
+            user_id: 用户ID
+
+        Returns:
+            int: 用户排名，不在排行榜中时返回 None
+        """
+        self.ensure_fresh()
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            return bisect.bisect_left(self._keys, self._sort_key(entry)) + 1
+
+    def get_around(self, user_id, count=5):
+        """
+        获取用户前后相邻的排行榜条目
+
+        Args:
+            user_id: 用户ID
+            count: 前后各取的数量
+
+        Returns:
+            list: 带排名的条目列表，用户不在排行榜中时返回空列表
+        """
+        rank = self.get_rank(user_id)
+        if rank is None:
+            return []
+
+        with self._lock:
+            start = max(rank - 1 - count, 0)
+            items = []
+            for position, key in enumerate(self._keys[start:rank + count], start=start + 1):
+                item = dict(self._entries[key[2]])
+                item['rank'] = position
+                items.append(item)
+
+        return items
+
+    def get_page(self, page=1, per_page=50):
+        """
+        获取排行榜分页数据
+
+        Args:
+            page: 页码
+            per_page: 每页数量
+
+        Returns:
+            dict: 包含 items（带排名的条目）、total 和 pages
+        """
+        self.ensure_fresh()
+
+        page = max(page, 1)
+        if per_page <= 0:
+            per_page = 20
+
+        with self._lock:
+            total = len(self._keys)
+            start = (page - 1) * per_page
+            items = []
+            for rank, key in enumerate(self._keys[start:start + per_page], start=start + 1):
+                item = dict(self._entries[key[2]])
+                item['rank'] = rank
+                items.append(item)
+
+        return {
+            'items': items,
+            'total': total,
+            'pages': math.ceil(total / per_page) if total else 0
+        }
+
+# 创建全局排行榜索引实例
+leaderboard_index = LeaderboardIndex()
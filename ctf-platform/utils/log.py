@@ -1,10 +1,135 @@
+import atexit
+import json
 import logging
 import os
+import queue
 import sys
-from logging.handlers import RotatingFileHandler
+import threading
+import time
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 from datetime import datetime
 from flask import request, current_app
 
+# LogRecord 的标准属性，其余属性视为通过 extra 传入的结构化字段
+_RECORD_ATTRS = set(logging.LogRecord('', 0, '', 0, '', None, None).__dict__) | {'message', 'asctime'}
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出一行 JSON，包含通过 extra 传入的结构化字段"""
+    
+    def format(self, record):
+        entry = {
+            'time': datetime.utcfromtimestamp(record.created).isoformat(timespec='milliseconds') + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'location': f'{record.pathname}:{record.lineno}'
+        }
+        
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class AsyncLogHandler(QueueHandler):
+    """
+    异步日志处理器
+    
+    请求线程只把日志记录放入有界队列，由独立的写入线程（QueueListener）执行
+    格式化、写文件、轮转和输出到控制台，文件轮转或终端阻塞不再拖慢请求。
+    队列满时丢弃记录并计数，队列恢复后写入一条丢弃数量的警告。
+    
+    写入线程在首次记录日志时按进程启动（兼容 gunicorn 预加载后 fork 的工作进程），
+    进程退出时刷新队列中剩余的记录。
+    """
+    
+    def __init__(self, handlers, queue_size=10000):
+        super().__init__(None)
+        self.targets = handlers
+        self.queue_size = queue_size
+        self.listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        
+        # 统计信息
+        self.enqueued = 0
+        self.dropped = 0
+        self._unreported = 0
+    
+    def _ensure_listener(self):
+        """按需启动写入线程（fork 后的子进程使用新的队列）"""
+        if self._pid == os.getpid():
+            return
+        
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            
+            self.queue = queue.Queue(self.queue_size)
+            self.listener = QueueListener(self.queue, *self.targets, respect_handler_level=True)
+            self.listener.start()
+            self._pid = os.getpid()
+            self.enqueued = 0
+            self.dropped = 0
+            self._unreported = 0
+    
+    def prepare(self, record):
+        # 只合并消息参数，格式化放在写入线程中进行
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+    
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self._unreported += 1
+            return
+        
+        self.enqueued += 1
+        if self._unreported:
+            dropped, self._unreported = self._unreported, 0
+            warning = logging.LogRecord(
+                record.name, logging.WARNING, __file__, 0,
+                f"SYSTEM - LOG_DROPPED - 日志队列已满，丢弃 {dropped} 条日志", None, None
+            )
+            try:
+                self.queue.put_nowait(warning)
+            except queue.Full:
+                self._unreported += dropped
+    
+    def emit(self, record):
+        self._ensure_listener()
+        super().emit(record)
+    
+    def stop(self):
+        """停止写入线程，写完队列中剩余的记录"""
+        if self.listener is not None and self._pid == os.getpid():
+            self.listener.stop()
+            self.listener = None
+            self._pid = None
+    
+    def stats(self):
+        """队列统计信息"""
+        return {
+            'enabled': True,
+            'queue_size': self.queue_size,
+            'pending': self.queue.qsize() if self._pid == os.getpid() else 0,
+            'enqueued': self.enqueued,
+            'dropped': self.dropped
+        }
+
+def get_log_stats(app):
+    """异步日志队列统计，未启用时只返回 enabled"""
+    handler = app.extensions.get('async_log_handler')
+    if handler is None:
+        return {'enabled': False}
+    return handler.stats()
+
 def setup_logging(app):
     """设置日志配置"""
     
@@ -15,10 +140,13 @@ def setup_logging(app):
     # 日志文件路径
     log_file = os.path.join(log_dir, 'ctf_platform.log')
     
-    # 设置日志格式
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s [in %(pathname)s:%(lineno)d]'
-    )
+    # 设置日志格式（LOG_FORMAT=json 时每行输出一条 JSON）
+    if app.config.get('LOG_FORMAT', 'text') == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s [in %(pathname)s:%(lineno)d]'
+        )
     
     # 文件处理器（按大小轮转）
     file_handler = RotatingFileHandler(
@@ -44,8 +172,18 @@ def setup_logging(app):
     app.logger.propagate = False
     
     # 添加自定义处理器
-    app.logger.addHandler(file_handler)
-    app.logger.addHandler(console_handler)
+    if app.config.get('LOG_ASYNC_ENABLED', True):
+        # 文件和控制台写入交给后台线程，请求线程只入队
+        async_handler = AsyncLogHandler(
+            [file_handler, console_handler],
+            queue_size=app.config.get('LOG_QUEUE_SIZE', 10000)
+        )
+        app.logger.addHandler(async_handler)
+        app.extensions['async_log_handler'] = async_handler
+        atexit.register(async_handler.stop)
+    else:
+        app.logger.addHandler(file_handler)
+        app.logger.addHandler(console_handler)
 
 def log_security_event(event_type, user_id, description, ip_address=None, severity='INFO'):
     """
@@ -95,7 +233,12 @@ def log_submission(user_id, challenge_id, is_correct, submitted_flag=None):
         masked_flag = "None"
     
     log_message = f"SUBMISSION - User:{user_id} - Challenge:{challenge_id} - Status:{status} - Flag:{masked_flag}"
-    logger.info(log_message)
+    logger.info(log_message, extra={
+        'event': 'submission',
+        'user_id': user_id,
+        'challenge_id': challenge_id,
+        'status': status
+    })
 
 def log_admin_action(admin_id, action, target_type, target_id, details=None):
     """
@@ -150,13 +293,13 @@ class RequestLogger:
         @app.before_request
         def before_request():
             # 记录请求开始时间
-            request.start_time = datetime.utcnow()
+            request.start_time = time.perf_counter()
         
         @app.after_request
         def after_request(response):
             # 计算请求处理时间
             if hasattr(request, 'start_time'):
-                processing_time = (datetime.utcnow() - request.start_time).total_seconds() * 1000
+                processing_time = (time.perf_counter() - request.start_time) * 1000
                 
                 # 记录请求日志（排除静态文件）
                 if not request.path.startswith('/static/'):
@@ -164,7 +307,15 @@ class RequestLogger:
                         f"REQUEST - {request.method} {request.path} - "
                         f"Status:{response.status_code} - "
                         f"Time:{processing_time:.2f}ms - "
-                        f"IP:{request.remote_addr}"
+                        f"IP:{request.remote_addr}",
+                        extra={
+                            'event': 'request',
+                            'method': request.method,
+                            'path': request.path,
+                            'status': response.status_code,
+                            'duration_ms': round(processing_time, 2),
+                            'ip': request.remote_addr
+                        }
                     )
             
             return response
@@ -0,0 +1,305 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from flask import request
+from utils.query_monitor import query_monitor
+
+# 默认的请求耗时分桶上界（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value):
+    """转义 Prometheus 标签值"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+class RequestMetrics:
+    """
+    请求延迟直方图和 /metrics 指标导出
+
+    按 (蓝图端点, 请求方法, 状态码类别) 记录请求耗时直方图以及每个请求的
+    数据库查询次数和耗时（读取 query_monitor 的请求统计）。每个线程写入
+    自己的分片，记录时不加锁，导出时再合并。
+
+    多个 gunicorn 工作进程各自计数：每个进程至多每 METRICS_SYNC_INTERVAL 秒
+    将快照写入 TEMP_FOLDER/metrics/worker-<pid>.json，/metrics 合并所有存活
+    进程的快照后以 Prometheus 文本格式输出，其他进程的数据最多延迟一个间隔。
+    """
+
+    SNAPSHOT_DIR = 'metrics'
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards = []
+        self._pid = None
+        self._last_sync = 0.0
+        self.app = None
+        self.enabled = True
+        self.buckets = DEFAULT_BUCKETS
+        self.sync_interval = 10
+        self.token = None
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        self.buckets = tuple(sorted(app.config.get('METRICS_BUCKETS') or DEFAULT_BUCKETS))
+        self.sync_interval = app.config.get('METRICS_SYNC_INTERVAL', 10)
+        self.token = app.config.get('METRICS_TOKEN')
+        self.snapshot_dir = os.path.join(app.config['TEMP_FOLDER'], self.SNAPSHOT_DIR)
+
+        if self.enabled:
+            app.before_request(self._start_request)
+            app.after_request(self._record_request)
+            app.teardown_request(self._end_request)
+
+    def _shard(self):
+        """当前线程的计数分片：key -> [各分桶计数..., +Inf 计数, 耗时总和, 查询次数, 查询耗时]"""
+        shard = getattr(self._local, 'shard', None)
+        if shard is None or self._local.pid != os.getpid():
+            shard = {}
+            self._local.shard = shard
+            self._local.pid = os.getpid()
+            with self._lock:
+                if self._pid != os.getpid():
+                    # fork 后不继承父进程的计数
+                    self._shards = []
+                    self._pid = os.getpid()
+                self._shards.append(shard)
+        return shard
+
+    def _start_request(self):
+        self._local.start_time = time.perf_counter()
+
+    def _end_request(self, exc=None):
+        self._local.start_time = None
+
+    def _record_request(self, response):
+        start_time = getattr(self._local, 'start_time', None)
+        if start_time is None:
+            return response
+
+        duration = time.perf_counter() - start_time
+        queries = query_monitor.current()
+        key = f"{request.endpoint or 'unmatched'}|{request.method}|{response.status_code // 100}xx"
+
+        shard = self._shard()
+        entry = shard.get(key)
+        if entry is None:
+            entry = shard[key] = [0] * (len(self.buckets) + 1) + [0.0, 0, 0.0]
+
+        entry[bisect_left(self.buckets, duration)] += 1
+        entry[-3] += duration
+        if queries is not None:
+            entry[-2] += queries.count
+            entry[-1] += queries.duration
+
+        if time.monotonic() - self._last_sync >= self.sync_interval:
+            self._write_snapshot()
+
+        return response
+
+    def _snapshot(self):
+        """合并本进程所有线程分片"""
+        merged = {}
+        with self._lock:
+            shards = list(self._shards) if self._pid == os.getpid() else []
+
+        for shard in shards:
+            for key, entry in list(shard.items()):
+                total = merged.get(key)
+                if total is None:
+                    merged[key] = list(entry)
+                else:
+                    for i, value in enumerate(entry):
+                        total[i] += value
+
+        return {
+            'pid': os.getpid(),
+            'buckets': list(self.buckets),
+            'requests': merged,
+            'components': self._component_stats()
+        }
+
+    def _write_snapshot(self):
+        """写入本进程快照，供其他工作进程合并"""
+        self._last_sync = time.monotonic()
+        snapshot = self._snapshot()
+        try:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            path = os.path.join(self.snapshot_dir, f'worker-{os.getpid()}.json')
+            temp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(temp_path, path)
+        except OSError as e:
+            self.app.logger.warning(f"写入指标快照失败: {str(e)}")
+        return snapshot
+
+    @staticmethod
+    def _is_alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _collect(self):
+        """本进程最新快照加上其他存活工作进程的快照"""
+        snapshots = [self._write_snapshot()]
+
+        # Windows 上 os.kill(pid, 0) 会发送 CTRL_C_EVENT，只导出本进程数据
+        if os.name == 'nt':
+            return snapshots
+
+        try:
+            names = os.listdir(self.snapshot_dir)
+        except OSError:
+            return snapshots
+
+        for name in names:
+            if not name.startswith('worker-') or not name.endswith('.json'):
+                continue
+            try:
+                pid = int(name[7:-5])
+            except ValueError:
+                continue
+            if pid == os.getpid():
+                continue
+
+            path = os.path.join(self.snapshot_dir, name)
+            if not self._is_alive(pid):
+                # 已退出进程的快照不再计入
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if snapshot.get('buckets') == list(self.buckets):
+                snapshots.append(snapshot)
+
+        return snapshots
+
+    def _component_stats(self):
+        """可跨进程累加的组件计数"""
+        from utils.auth import identity_cache
+        from utils.password_pool import password_pool
+        from utils.submission_buffer import submission_buffer
+        from utils.log import get_log_stats
+
+        cache = identity_cache.stats()
+        pool = password_pool.stats()
+        buffer = submission_buffer.stats()
+        log = get_log_stats(self.app)
+        sql = query_monitor.stats()
+
+        return {
+            'ctf_identity_cache_hits_total': cache['hits'],
+            'ctf_identity_cache_misses_total': cache['misses'],
+            'ctf_identity_cache_token_hits_total': cache['token_hits'],
+            'ctf_identity_cache_token_misses_total': cache['token_misses'],
+            'ctf_identity_cache_entries': cache['users'],
+            'ctf_password_hash_completed_total': pool['completed'],
+            'ctf_password_hash_rejected_total': pool['rejected'],
+            'ctf_password_hash_timeouts_total': pool['timeouts'],
+            'ctf_password_hash_pending': pool['pending'],
+            'ctf_submission_buffer_pending': buffer['pending'],
+            'ctf_submission_buffer_flushed_rows_total': buffer['flushed_rows'],
+            'ctf_submission_buffer_failed_flushes_total': buffer['failed_flushes'],
+            'ctf_submission_buffer_dropped_rows_total': buffer['dropped_rows'],
+            'ctf_submission_buffer_rejected_rows_total': buffer['rejected_rows'],
+            'ctf_log_queue_pending': log.get('pending', 0),
+            'ctf_log_records_dropped_total': log.get('dropped', 0),
+            'ctf_sql_n_plus_one_total': sql['n_plus_one_detected'],
+            'ctf_sql_slow_requests_total': sql['slow_requests']
+        }
+
+    def render(self):
+        """
+        以 Prometheus 文本格式导出所有工作进程合并后的指标
+
+        Returns:
+            str: text/plain; version=0.0.4 格式的指标
+        """
+        snapshots = self._collect()
+
+        requests = {}
+        components = {}
+        for snapshot in snapshots:
+            for key, entry in snapshot['requests'].items():
+                total = requests.get(key)
+                if total is None:
+                    requests[key] = list(entry)
+                else:
+                    for i, value in enumerate(entry):
+                        total[i] += value
+            for name, value in snapshot['components'].items():
+                components[name] = components.get(name, 0) + value
+
+        lines = [
+            '# HELP ctf_http_request_duration_seconds Request latency by endpoint.',
+            '# TYPE ctf_http_request_duration_seconds histogram'
+        ]
+        bounds = [_format_value(float(b)) for b in self.buckets] + ['+Inf']
+        for key in sorted(requests):
+            endpoint, method, status = key.split('|')
+            labels = f'endpoint="{_escape(endpoint)}",method="{method}",status="{status}"'
+            entry = requests[key]
+            cumulative = 0
+            for bound, count in zip(bounds, entry):
+                cumulative += count
+                lines.append(f'ctf_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'ctf_http_request_duration_seconds_sum{{{labels}}} {_format_value(entry[-3])}')
+            lines.append(f'ctf_http_request_duration_seconds_count{{{labels}}} {cumulative}')
+
+        for name, index, help_text in (
+            ('ctf_http_request_db_queries_total', -2, 'Database queries executed by requests.'),
+            ('ctf_http_request_db_seconds_total', -1, 'Time spent in database queries by requests.')
+        ):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for key in sorted(requests):
+                endpoint, method, status = key.split('|')
+                labels = f'endpoint="{_escape(endpoint)}",method="{method}",status="{status}"'
+                lines.append(f'{name}{{{labels}}} {_format_value(requests[key][index])}')
+
+        for name in sorted(components):
+            metric_type = 'counter' if name.endswith('_total') else 'gauge'
+            lines.append(f'# TYPE {name} {metric_type}')
+            lines.append(f'{name} {_format_value(components[name])}')
+
+        lines.append('# TYPE ctf_metrics_workers gauge')
+        lines.append(f'ctf_metrics_workers {len(snapshots)}')
+
+        # 调度器只在执行者进程运行，读取其共享指标文件
+        from utils.score_scheduler import score_scheduler
+        scheduler = score_scheduler.stats().get('metrics')
+        if scheduler:
+            lines.append('# TYPE ctf_score_scheduler_runs_total counter')
+            lines.append(f"ctf_score_scheduler_runs_total {scheduler['runs']}")
+            lines.append('# TYPE ctf_score_scheduler_failures_total counter')
+            lines.append(f"ctf_score_scheduler_failures_total {scheduler['failures']}")
+            if scheduler.get('last_duration_ms') is not None:
+                lines.append('# TYPE ctf_score_scheduler_last_duration_seconds gauge')
+                lines.append(f"ctf_score_scheduler_last_duration_seconds {_format_value(scheduler['last_duration_ms'] / 1000)}")
+
+        return '\n'.join(lines) + '\n'
+
+# 创建全局请求指标实例
+request_metrics = RequestMetrics()
@@ -0,0 +1,157 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash
+
+class PasswordPoolBusy(Exception):
+    """密码哈希队列已满或等待超时，调用方应返回 503"""
+
+    def __init__(self, retry_after=1):
+        super().__init__('Password hashing pool is busy')
+        self.retry_after = retry_after
+
+class PasswordHashPool:
+    """
+    密码哈希工作池
+
+    登录、注册和修改密码时的 PBKDF2/scrypt 计算放到固定数量的工作线程中执行
+    （hashlib 计算期间释放 GIL），同时进行的哈希数量不超过
+    PASSWORD_HASH_WORKERS，其余 CPU 留给其他接口。排队数量达到
+    PASSWORD_HASH_QUEUE_LIMIT 或等待超过 PASSWORD_HASH_TIMEOUT 秒时立即抛出
+    PasswordPoolBusy，由路由返回 503，而不是让请求线程堆积。
+
+    设置 PASSWORD_HASH_METHOD 后，新密码使用该参数哈希；登录成功且已存储的
+    哈希参数不同时，在同一工作池中重新哈希并更新（透明升级或调低成本）。
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._pending = 0
+        self.enabled = True
+        self.workers = 1
+        self.queue_limit = 32
+        self.timeout = 5.0
+        self.method = None
+        self.method_prefix = None
+
+        # 统计信息
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.rehashed = 0
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('PASSWORD_HASH_POOL_ENABLED', True)
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS') or max(1, (os.cpu_count() or 2) // 2)
+        self.queue_limit = app.config.get('PASSWORD_HASH_QUEUE_LIMIT', 32)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', 5.0)
+        self.method = app.config.get('PASSWORD_HASH_METHOD')
+
+        # werkzeug 存储的是补全后的参数（如 pbkdf2 -> pbkdf2:sha256:600000），
+        # 生成一次哈希取得前缀用于比较；参数无效时在启动时报错
+        self.method_prefix = None
+        if self.method:
+            self.method_prefix = generate_password_hash('', method=self.method).split('$', 1)[0]
+
+    def _get_executor(self):
+        """按需创建线程池（兼容 fork 后的工作进程）"""
+        if self._executor is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._pending = 0
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+        return self._executor
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+            self.completed += 1
+
+    def _run(self, func, *args):
+        if not self.enabled:
+            return func(*args)
+
+        with self._lock:
+            executor = self._get_executor()
+            if self._pending >= self.queue_limit:
+                self.rejected += 1
+                raise PasswordPoolBusy()
+            self._pending += 1
+            future = executor.submit(func, *args)
+
+        future.add_done_callback(self._done)
+
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # 已排队的任务无法撤回，取消尚未开始的任务
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            raise PasswordPoolBusy()
+
+    def _generate(self, password):
+        if self.method:
+            return generate_password_hash(password, method=self.method)
+        return generate_password_hash(password)
+
+    def hash_password(self, password):
+        """
+        在工作池中生成密码哈希
+
+        Raises:
+            PasswordPoolBusy: 队列已满或等待超时
+        """
+        return self._run(self._generate, password)
+
+    def _check(self, password_hash, password):
+        if not check_password_hash(password_hash, password):
+            return False, None
+
+        # 已存储的哈希参数与目标参数不同时重新哈希
+        if self.method_prefix and password_hash.split('$', 1)[0] != self.method_prefix:
+            return True, self._generate(password)
+        return True, None
+
+    def check_password(self, user, password):
+        """
+        在工作池中校验用户密码，需要时更新为 PASSWORD_HASH_METHOD 参数的哈希
+
+        调用方负责提交事务。
+
+        Returns:
+            bool: 密码是否正确
+
+        Raises:
+            PasswordPoolBusy: 队列已满或等待超时
+        """
+        if not user.password_hash:
+            return False
+
+        valid, new_hash = self._run(self._check, user.password_hash, password)
+        if new_hash:
+            user.password_hash = new_hash
+            with self._lock:
+                self.rehashed += 1
+        return valid
+
+    def stats(self):
+        """工作池统计信息"""
+        return {
+            'enabled': self.enabled,
+            'workers': self.workers,
+            'queue_limit': self.queue_limit,
+            'pending': self._pending,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+            'rehashed': self.rehashed,
+            'method': self.method
+        }
+
+# 创建全局密码哈希工作池实例
+password_pool = PasswordHashPool()
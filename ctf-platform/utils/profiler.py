@@ -0,0 +1,258 @@
+import cProfile
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from flask import request
+
+# 分析文件ID格式，防止路径穿越
+PROFILE_ID_PATTERN = re.compile(r'^[0-9]{8}T[0-9]{6}-[0-9]+-[0-9]+$')
+
+# 支持的函数排序方式
+SORT_KEYS = ('cumulative', 'tottime', 'calls')
+
+class RequestProfiler:
+    """
+    按需请求性能分析
+
+    启用 PROFILING_ENABLED 后，管理员请求携带 PROFILING_HEADER 请求头（默认
+    X-Profile: 1）或按 PROFILING_SAMPLE_RATE 随机抽样的请求会在 cProfile 下执行，
+    结果以 pstats 格式（.prof）和元数据（.json，含耗时最多的函数）保存到
+    TEMP_FOLDER/profiles，响应头 X-Profile-Id 返回分析ID，最多保留
+    PROFILING_MAX_FILES 份。每个进程同一时间只分析一个请求。
+
+    未启用时不注册任何请求钩子，没有额外开销。
+    """
+
+    PROFILE_DIR = 'profiles'
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._counter_lock = threading.Lock()
+        self._local = threading.local()
+        self._counter = 0
+        self.app = None
+        self.enabled = False
+        self.header = 'X-Profile'
+        self.sample_rate = 0.0
+        self.max_files = 100
+        self.top_functions = 30
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('PROFILING_ENABLED', False)
+        self.header = app.config.get('PROFILING_HEADER', 'X-Profile')
+        self.sample_rate = app.config.get('PROFILING_SAMPLE_RATE', 0.0)
+        self.max_files = app.config.get('PROFILING_MAX_FILES', 100)
+        self.profile_dir = os.path.join(app.config['TEMP_FOLDER'], self.PROFILE_DIR)
+
+        if self.enabled:
+            app.before_request(self._start_profile)
+            app.after_request(self._finish_profile)
+            app.teardown_request(self._abort_profile)
+
+    def _requested_by_admin(self):
+        """请求头触发时校验管理员身份"""
+        from utils.auth import identity_cache
+
+        token = request.headers.get('Authorization', '')
+        if token.startswith('Bearer '):
+            token = token[7:]
+        if not token:
+            return None
+
+        try:
+            data = identity_cache.decode_token(token)
+            user = identity_cache.get_user(data['user_id'])
+        except Exception:
+            return None
+
+        return user.id if user is not None and user.is_admin else None
+
+    def _start_profile(self):
+        trigger = None
+        user_id = None
+
+        if request.headers.get(self.header):
+            user_id = self._requested_by_admin()
+            if user_id is not None:
+                trigger = 'header'
+        if trigger is None and self.sample_rate and random.random() < self.sample_rate:
+            trigger = 'sample'
+        if trigger is None:
+            return
+
+        # cProfile 不能在多个线程中同时启用
+        if not self._lock.acquire(blocking=False):
+            return
+
+        profile = cProfile.Profile()
+        self._local.current = (profile, trigger, user_id, time.perf_counter())
+        profile.enable()
+
+    def _stop(self):
+        current = getattr(self._local, 'current', None)
+        if current is None:
+            return None
+
+        self._local.current = None
+        current[0].disable()
+        self._lock.release()
+        return current
+
+    def _finish_profile(self, response):
+        current = self._stop()
+        if current is None:
+            return response
+
+        profile, trigger, user_id, started_at = current
+        try:
+            profile_id = self._save(profile, {
+                'method': request.method,
+                'path': request.path,
+                'endpoint': request.endpoint,
+                'status': response.status_code,
+                'duration_ms': round((time.perf_counter() - started_at) * 1000, 2),
+                'trigger': trigger,
+                'user_id': user_id
+            })
+            response.headers['X-Profile-Id'] = profile_id
+        except OSError as e:
+            self.app.logger.warning(f"保存性能分析结果失败: {str(e)}")
+
+        return response
+
+    def _abort_profile(self, exc=None):
+        # 未执行 after_request 时（如响应生成前出错）停止分析并释放锁
+        self._stop()
+
+    def _summarize(self, profile, sort='cumulative', limit=None):
+        """耗时最多的函数列表"""
+        stats = pstats.Stats(profile).sort_stats(sort)
+        root = os.path.dirname(self.app.root_path)
+        functions = []
+
+        for func in stats.fcn_list[:limit or self.top_functions]:
+            calls, total_calls, tottime, cumtime, _ = stats.stats[func]
+            filename, line, name = func
+            if filename.startswith(root):
+                filename = os.path.relpath(filename, root)
+            functions.append({
+                'function': f'{filename}:{line}({name})',
+                'calls': total_calls,
+                'primitive_calls': calls,
+                'tottime_ms': round(tottime * 1000, 3),
+                'cumtime_ms': round(cumtime * 1000, 3)
+            })
+
+        return functions
+
+    def _save(self, profile, meta):
+        with self._counter_lock:
+            self._counter += 1
+            counter = self._counter
+
+        now = datetime.utcnow()
+        profile_id = f"{now.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{counter}"
+        os.makedirs(self.profile_dir, exist_ok=True)
+
+        profile.dump_stats(os.path.join(self.profile_dir, f'{profile_id}.prof'))
+        meta = dict(meta, id=profile_id, created_at=now.isoformat(), top=self._summarize(profile))
+        with open(os.path.join(self.profile_dir, f'{profile_id}.json'), 'w') as f:
+            json.dump(meta, f)
+
+        self._prune()
+        return profile_id
+
+    def _prune(self):
+        """只保留最新的 PROFILING_MAX_FILES 份分析结果"""
+        entries = sorted(
+            (entry for entry in os.scandir(self.profile_dir) if entry.name.endswith('.json')),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        for entry in entries[:max(0, len(entries) - self.max_files)]:
+            self.delete(entry.name[:-5])
+
+    def _path(self, profile_id, extension):
+        if not PROFILE_ID_PATTERN.match(profile_id or ''):
+            return None
+        return os.path.join(self.profile_dir, f'{profile_id}.{extension}')
+
+    def list_profiles(self):
+        """
+        已保存的分析结果（不含函数列表），按时间倒序
+
+        Returns:
+            list: 元数据列表
+        """
+        profiles = []
+        try:
+            names = os.listdir(self.profile_dir)
+        except OSError:
+            return profiles
+
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.profile_dir, name)) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            meta.pop('top', None)
+            profiles.append(meta)
+
+        profiles.sort(key=lambda meta: meta.get('created_at') or '', reverse=True)
+        return profiles
+
+    def get_profile(self, profile_id, sort=None, limit=None):
+        """
+        分析结果元数据；指定 sort（cumulative/tottime/calls）时从 .prof 重新排序
+
+        Returns:
+            dict: 元数据，不存在时返回 None
+
+        Raises:
+            ValueError: 排序方式无效
+        """
+        if sort and sort not in SORT_KEYS:
+            raise ValueError(f"sort must be one of: {', '.join(SORT_KEYS)}")
+
+        path = self._path(profile_id, 'json')
+        if path is None or not os.path.exists(path):
+            return None
+
+        with open(path) as f:
+            meta = json.load(f)
+
+        prof_path = self.profile_file(profile_id)
+        if (sort or limit) and prof_path:
+            meta['top'] = self._summarize(prof_path, sort or 'cumulative', limit)
+        return meta
+
+    def profile_file(self, profile_id):
+        """pstats 文件路径，不存在时返回 None"""
+        path = self._path(profile_id, 'prof')
+        if path is None or not os.path.exists(path):
+            return None
+        return path
+
+    def delete(self, profile_id):
+        """删除分析结果，返回是否存在"""
+        deleted = False
+        for extension in ('prof', 'json'):
+            path = self._path(profile_id, extension)
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+                deleted = True
+        return deleted
+
+# 创建全局请求分析器实例
+request_profiler = RequestProfiler()
@@ -0,0 +1,221 @@
+import re
+import threading
+import time
+from contextlib import contextmanager
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 日志中语句的最大长度
+MAX_STATEMENT_LENGTH = 300
+
+_IN_LIST = re.compile(r'\(\s*(?:\?|%s|:\w+|%\(\w+\)s)(?:\s*,\s*(?:\?|%s|:\w+|%\(\w+\)s))*\s*\)')
+_NUMBER = re.compile(r'\b\d+\b')
+_SPACE = re.compile(r'\s+')
+
+def fingerprint(statement):
+    """规范化 SQL 语句：合并 IN 列表占位符、数字字面量和空白"""
+    statement = _IN_LIST.sub('(?)', statement)
+    statement = _NUMBER.sub('N', statement)
+    return _SPACE.sub(' ', statement).strip()
+
+class QueryStats:
+    """一个统计范围（一次请求或一个 query_budget 块）内的查询计数"""
+
+    __slots__ = ('started_at', 'count', 'duration', 'statements')
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.count = 0
+        self.duration = 0.0
+        self.statements = {}    # 原始语句 -> [次数, 耗时]
+
+    def record(self, statement, elapsed):
+        self.count += 1
+        self.duration += elapsed
+        entry = self.statements.get(statement)
+        if entry is None:
+            self.statements[statement] = [1, elapsed]
+        else:
+            entry[0] += 1
+            entry[1] += elapsed
+
+    def repeated(self, threshold):
+        """
+        按规范化语句合并后，执行次数达到阈值的语句
+
+        Returns:
+            list: [(规范化语句, 次数, 耗时)]，按次数降序
+        """
+        grouped = {}
+        for statement, (count, elapsed) in self.statements.items():
+            key = fingerprint(statement)
+            entry = grouped.setdefault(key, [0, 0.0])
+            entry[0] += count
+            entry[1] += elapsed
+
+        return sorted(
+            ((key, count, elapsed) for key, (count, elapsed) in grouped.items() if count >= threshold),
+            key=lambda item: item[1],
+            reverse=True
+        )
+
+class QueryMonitor:
+    """
+    SQL 查询监控和 N+1 检测
+
+    通过 SQLAlchemy 游标执行事件统计每个请求的查询次数、数据库耗时和各语句的
+    执行次数（只统计请求线程，后台线程的查询不计入）。请求结束时：
+
+    - 同一规范化语句（合并 IN 列表和数字）执行次数达到 QUERY_MONITOR_N_PLUS_ONE_THRESHOLD
+      时记录 SQL - N_PLUS_ONE 警告及该语句
+    - 请求耗时超过 QUERY_MONITOR_SLOW_REQUEST_MS 时记录 SQL - SLOW_REQUEST 警告，
+      附带查询次数、数据库耗时和执行次数最多的语句
+
+    request_metrics 从当前请求的统计中读取查询次数和耗时。
+    """
+
+    def __init__(self, app=None):
+        self._local = threading.local()
+        self.app = None
+        self.enabled = True
+        self.slow_request_ms = 500
+        self.n_plus_one_threshold = 10
+
+        # 统计信息
+        self.n_plus_one_detected = 0
+        self.slow_requests = 0
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('QUERY_MONITOR_ENABLED', True)
+        self.slow_request_ms = app.config.get('QUERY_MONITOR_SLOW_REQUEST_MS', 500)
+        self.n_plus_one_threshold = app.config.get('QUERY_MONITOR_N_PLUS_ONE_THRESHOLD', 10)
+
+        # query_budget 在未启用监控时也需要统计查询
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+
+        if self.enabled:
+            app.before_request(self._start_request)
+            app.teardown_request(self._end_request)
+
+    def _scopes(self):
+        scopes = getattr(self._local, 'scopes', None)
+        if scopes is None:
+            scopes = self._local.scopes = []
+        return scopes
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if getattr(self._local, 'scopes', None):
+            conn.info['query_monitor_start'] = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = conn.info.pop('query_monitor_start', None)
+        scopes = getattr(self._local, 'scopes', None)
+        if start is None or not scopes:
+            return
+
+        elapsed = time.perf_counter() - start
+        for scope in scopes:
+            scope.record(statement, elapsed)
+
+    def _start_request(self):
+        stats = QueryStats()
+        self._local.request = stats
+        self._scopes().append(stats)
+
+    def current(self):
+        """当前请求的查询统计，不在请求中或未启用时返回 None"""
+        return getattr(self._local, 'request', None)
+
+    def _end_request(self, exc=None):
+        stats = getattr(self._local, 'request', None)
+        if stats is None:
+            return
+
+        self._local.request = None
+        scopes = self._scopes()
+        if stats in scopes:
+            scopes.remove(stats)
+
+        try:
+            self._report(stats)
+        except Exception as e:
+            self.app.logger.error(f"记录查询统计失败: {str(e)}")
+
+    def _report(self, stats):
+        duration_ms = (time.perf_counter() - stats.started_at) * 1000
+        target = f"{request.method} {request.path}"
+        fields = {
+            'event': 'sql',
+            'endpoint': request.endpoint,
+            'method': request.method,
+            'path': request.path,
+            'queries': stats.count,
+            'db_time_ms': round(stats.duration * 1000, 2),
+            'duration_ms': round(duration_ms, 2)
+        }
+
+        repeated = stats.repeated(self.n_plus_one_threshold)
+        if repeated:
+            self.n_plus_one_detected += 1
+            statement, count, elapsed = repeated[0]
+            self.app.logger.warning(
+                f"SQL - N_PLUS_ONE - {target} - "
+                f"{count}x {elapsed * 1000:.2f}ms - {statement[:MAX_STATEMENT_LENGTH]}",
+                extra=dict(fields, statement=statement[:MAX_STATEMENT_LENGTH], repeats=count)
+            )
+
+        if duration_ms >= self.slow_request_ms:
+            self.slow_requests += 1
+            top = max(stats.statements.items(), key=lambda item: item[1][1], default=None)
+            statement = fingerprint(top[0])[:MAX_STATEMENT_LENGTH] if top else None
+            self.app.logger.warning(
+                f"SQL - SLOW_REQUEST - {target} - Time:{duration_ms:.2f}ms - "
+                f"Queries:{stats.count} - DB:{stats.duration * 1000:.2f}ms - Slowest:{statement}",
+                extra=dict(fields, statement=statement)
+            )
+
+    @contextmanager
+    def budget(self, max_queries):
+        """
+        限制代码块内当前线程执行的查询次数，超出时抛出 AssertionError
+
+        用于测试中约束接口的查询数量，例如：
+
+            with query_monitor.budget(5):
+                client.get('/api/v1/submissions', headers=headers)
+        """
+        stats = QueryStats()
+        scopes = self._scopes()
+        scopes.append(stats)
+        try:
+            yield stats
+        finally:
+            scopes.remove(stats)
+
+        if stats.count > max_queries:
+            statements = '\n'.join(
+                f'  {count}x {statement[:MAX_STATEMENT_LENGTH]}'
+                for statement, count, _ in stats.repeated(1)
+            )
+            raise AssertionError(f'Executed {stats.count} queries, budget is {max_queries}:\n{statements}')
+
+    def stats(self):
+        """监控统计信息"""
+        return {
+            'enabled': self.enabled,
+            'n_plus_one_detected': self.n_plus_one_detected,
+            'slow_requests': self.slow_requests
+        }
+
+# 创建全局查询监控实例
+query_monitor = QueryMonitor()
+
+def query_budget(max_queries):
+    """query_monitor.budget 的简写"""
+    return query_monitor.budget(max_queries)
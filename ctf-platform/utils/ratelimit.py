@@ -0,0 +1,190 @@
+import math
+import threading
+import time
+from collections import deque
+from functools import wraps
+from flask import request, jsonify, current_app
+from utils.auth import verify_token
+
+try:
+    import redis
+except ImportError:  # redis 为可选依赖
+    redis = None
+
+class MemoryRateLimitBackend:
+    """进程内滑动窗口限流后端（每个工作进程独立计数）"""
+
+    # 每处理多少次请求清理一次过期的键
+    SWEEP_INTERVAL = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hits = {}
+        self._calls = 0
+
+    def hit(self, key, limit, window):
+        """
+        记录一次请求
+
+        Args:
+            key: 限流键
+            limit: 窗口内允许的最大请求数
+            window: 窗口长度（秒）
+
+        Returns:
+            tuple: (是否允许, 需要等待的秒数)
+        """
+        now = time.monotonic()
+        cutoff = now - window
+
+        with self._lock:
+            self._calls += 1
+            if self._calls % self.SWEEP_INTERVAL == 0:
+                self._sweep(cutoff)
+
+            timestamps = self._hits.get(key)
+            if timestamps is None:
+                timestamps = self._hits[key] = deque()
+
+            while timestamps and timestamps[0] <= cutoff:
+                timestamps.popleft()
+
+            if len(timestamps) >= limit:
+                return False, timestamps[0] - cutoff
+
+            timestamps.append(now)
+            return True, 0
+
+    def _sweep(self, cutoff):
+        expired = [key for key, timestamps in self._hits.items()
+                   if not timestamps or timestamps[-1] <= cutoff]
+        for key in expired:
+            del self._hits[key]
+
+class RedisRateLimitBackend:
+    """
+    Redis 滑动窗口计数限流后端（多个工作进程共享计数）
+
+    按当前窗口和上一窗口的计数加权估算滑动窗口内的请求数，
+    每次请求只需执行一次 Lua 脚本。与内存后端一致，先检查再计数，
+    被拒绝的请求不计入窗口。任何支持 Lua 脚本的 Redis 协议服务均可使用。
+    """
+
+    # KEYS: 当前窗口键、上一窗口键；ARGV: 上一窗口权重、限制次数、键过期秒数
+    HIT_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+if previous * tonumber(ARGV[1]) + current + 1 > tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+    def __init__(self, client, prefix='ratelimit:'):
+        self.client = client
+        self.prefix = prefix
+        self._hit_script = client.register_script(self.HIT_SCRIPT)
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        if redis is None:
+            raise RuntimeError('redis package is required for the redis rate limit backend')
+        return cls(redis.Redis.from_url(url, socket_timeout=0.5), **kwargs)
+
+    def hit(self, key, limit, window):
+        """
+        记录一次请求
+
+        Args:
+            key: 限流键
+            limit: 窗口内允许的最大请求数
+            window: 窗口长度（秒）
+
+        Returns:
+            tuple: (是否允许, 需要等待的秒数)
+        """
+        now = time.time()
+        current_window = int(now // window)
+        current_key = f'{self.prefix}{key}:{current_window}'
+        previous_key = f'{self.prefix}{key}:{current_window - 1}'
+
+        elapsed = now - current_window * window
+        weight = (window - elapsed) / window
+        allowed = self._hit_script(
+            keys=[current_key, previous_key],
+            args=[repr(weight), limit, window * 2]
+        )
+
+        if not allowed:
+            return False, window - elapsed
+
+        return True, 0
+
+class SubmissionRateLimiter:
+    """
+    Flag 提交限流器
+
+    在 token 校验和任何数据库操作之前执行：限流键直接从 JWT 中解析出的
+    用户ID生成（无法解析时使用客户端IP），被拒绝的请求不会访问数据库。
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.limit = 30
+        self.window = 60
+        self.backend = None
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RATE_LIMITING_ENABLED', False)
+        self.limit = app.config.get('MAX_SUBMISSIONS_PER_MINUTE', 30)
+        self.window = 60
+
+        backend = app.config.get('RATE_LIMIT_BACKEND', 'memory')
+        if backend == 'redis':
+            self.backend = RedisRateLimitBackend.from_url(app.config['REDIS_URL'])
+        else:
+            self.backend = MemoryRateLimitBackend()
+
+    @staticmethod
+    def _get_key():
+        token = request.headers.get('Authorization')
+        data = verify_token(token) if token else None
+
+        if data and 'user_id' in data:
+            return f"submit:user:{data['user_id']}"
+        return f'submit:ip:{request.remote_addr}'
+
+    def limit_submissions(self, f):
+        """提交限流装饰器，需放在 token_required 之前"""
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if not self.enabled:
+                return f(*args, **kwargs)
+
+            try:
+                allowed, retry_after = self.backend.hit(self._get_key(), self.limit, self.window)
+            except Exception as e:
+                # 限流后端不可用时放行，避免影响正常提交
+                current_app.logger.warning(f"提交限流失败: {str(e)}")
+                return f(*args, **kwargs)
+
+            if not allowed:
+                retry_after = max(1, math.ceil(retry_after))
+                response = jsonify({
+                    'message': 'Too many submissions! Please slow down.',
+                    'retry_after': retry_after
+                })
+                response.headers['Retry-After'] = str(retry_after)
+                return response, 429
+
+            return f(*args, **kwargs)
+
+        return decorated
+
+# 创建全局提交限流器实例
+submission_limiter = SubmissionRateLimiter()
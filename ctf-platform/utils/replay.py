@@ -0,0 +1,183 @@
+import time
+from flask import current_app
+from sqlalchemy import insert, update, delete
+from models import db, User, Challenge, Submission, Solve
+from utils.scoring import ScoringSystem
+
+# 每批读取/写入的行数
+DEFAULT_BATCH_SIZE = 5000
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def replay_scores(batch_size=DEFAULT_BATCH_SIZE, dry_run=False):
+    """
+    按提交记录重放计分，重建所有派生数据并只写回差异
+
+    按 (submitted_at, id) 顺序以服务端游标流式读取正确提交，重建解题记录
+    （含解题顺序和血量奖励）、题目解题人数、一血和用户总分（题目当前分数，
+    启用 BLOOD_BONUS_ENABLED 时加上 calculate_blood_bonus 奖励），再与数据库
+    现有数据对比，只插入/删除/更新不一致的行。内存占用与解题记录数成正比，
+    与提交总数无关。
+
+    Args:
+        batch_size: 游标每批读取和批量写入的行数
+        dry_run: 只统计差异，不写入数据库
+
+    Returns:
+        dict: 读取的提交数和各类数据的变更行数、耗时（毫秒）
+    """
+    start_time = time.perf_counter()
+    bonus_enabled = current_app.config.get('BLOOD_BONUS_ENABLED', False)
+
+    # 1. 按时间顺序重放正确提交：每个用户每道题取第一次正确提交
+    replayed = {}           # (user_id, challenge_id) -> (submission_id, solved_at, position, bonus)
+    solve_counts = {}       # challenge_id -> 解题人数
+    first_bloods = {}       # challenge_id -> 一血用户ID
+    scanned = 0
+
+    correct_submissions = db.session.query(
+        Submission.id,
+        Submission.user_id,
+        Submission.challenge_id,
+        Submission.submitted_at
+    ).join(
+        User, User.id == Submission.user_id
+    ).join(
+        Challenge, Challenge.id == Submission.challenge_id
+    ).filter(
+        Submission.is_correct == True
+    ).order_by(
+        Submission.submitted_at, Submission.id
+    ).yield_per(batch_size)
+
+    for submission_id, user_id, challenge_id, submitted_at in correct_submissions:
+        scanned += 1
+        key = (user_id, challenge_id)
+        if key in replayed:
+            continue
+
+        position = solve_counts.get(challenge_id, 0) + 1
+        solve_counts[challenge_id] = position
+        if position == 1:
+            first_bloods[challenge_id] = user_id
+
+        bonus = ScoringSystem.calculate_blood_bonus(position) if bonus_enabled else 0
+        replayed[key] = (submission_id, submitted_at, position, bonus)
+
+    # 2. 对比解题记录
+    solve_deletes = []
+    solve_updates = []
+    remaining = set(replayed)
+
+    existing_solves = db.session.query(
+        Solve.id,
+        Solve.user_id,
+        Solve.challenge_id,
+        Solve.submission_id,
+        Solve.solved_at,
+        Solve.position,
+        Solve.bonus
+    ).yield_per(batch_size)
+
+    for solve_id, user_id, challenge_id, submission_id, solved_at, position, bonus in existing_solves:
+        expected = replayed.get((user_id, challenge_id))
+        if expected is None:
+            solve_deletes.append(solve_id)
+            continue
+
+        remaining.discard((user_id, challenge_id))
+        if (submission_id, solved_at, position, bonus) != expected:
+            solve_updates.append({
+                'id': solve_id,
+                'submission_id': expected[0],
+                'solved_at': expected[1],
+                'position': expected[2],
+                'bonus': expected[3]
+            })
+
+    solve_inserts = []
+    for user_id, challenge_id in sorted(remaining):
+        submission_id, solved_at, position, bonus = replayed[(user_id, challenge_id)]
+        solve_inserts.append({
+            'user_id': user_id,
+            'challenge_id': challenge_id,
+            'submission_id': submission_id,
+            'solved_at': solved_at,
+            'position': position,
+            'bonus': bonus
+        })
+
+    # 3. 对比题目解题人数和一血
+    user_scores = {}
+    points = dict(db.session.query(Challenge.id, Challenge.points).all())
+
+    for (user_id, challenge_id), (_, _, _, bonus) in replayed.items():
+        user_scores[user_id] = user_scores.get(user_id, 0) + (points[challenge_id] or 0) + bonus
+
+    challenge_updates = []
+    for challenge_id, solved_count, solve_sequence, first_blood_user_id in db.session.query(
+        Challenge.id, Challenge.solved_count, Challenge.solve_sequence, Challenge.first_blood_user_id
+    ):
+        # 重放重新编排了解题顺序，顺序计数与之一致
+        expected_count = solve_counts.get(challenge_id, 0)
+        expected_blood = first_bloods.get(challenge_id)
+        if ((solved_count or 0) != expected_count or (solve_sequence or 0) != expected_count
+                or first_blood_user_id != expected_blood):
+            challenge_updates.append({
+                'id': challenge_id,
+                'solved_count': expected_count,
+                'solve_sequence': expected_count,
+                'first_blood_user_id': expected_blood
+            })
+
+    # 4. 对比用户总分
+    user_updates = [
+        {'id': user_id, 'score': user_scores.get(user_id, 0)}
+        for user_id, score in db.session.query(User.id, User.score).yield_per(batch_size)
+        if (score or 0) != user_scores.get(user_id, 0)
+    ]
+
+    stats = {
+        'submissions_scanned': scanned,
+        'solves': len(replayed),
+        'solves_inserted': len(solve_inserts),
+        'solves_updated': len(solve_updates),
+        'solves_deleted': len(solve_deletes),
+        'challenges_updated': len(challenge_updates),
+        'users_updated': len(user_updates),
+        'dry_run': dry_run
+    }
+
+    changed = solve_inserts or solve_updates or solve_deletes or challenge_updates or user_updates
+    if dry_run or not changed:
+        db.session.rollback()
+        stats['duration_ms'] = round((time.perf_counter() - start_time) * 1000, 2)
+        return stats
+
+    # 5. 批量写回差异（先删除再插入，避免触发唯一约束）
+    for ids in _chunks(solve_deletes, batch_size):
+        db.session.execute(delete(Solve).where(Solve.id.in_(ids)))
+    for rows in _chunks(solve_updates, batch_size):
+        db.session.execute(update(Solve), rows)
+    for rows in _chunks(solve_inserts, batch_size):
+        db.session.execute(insert(Solve), rows)
+    for rows in _chunks(challenge_updates, batch_size):
+        db.session.execute(update(Challenge), rows)
+    for rows in _chunks(user_updates, batch_size):
+        db.session.execute(update(User), rows)
+
+    db.session.commit()
+
+    # 派生数据已变化，刷新缓存
+    from utils.catalog import challenge_catalog
+    from utils.leaderboard import leaderboard_index
+    from utils.auth import identity_cache
+    challenge_catalog.bump_version()
+    leaderboard_index.invalidate()
+    if user_updates:
+        identity_cache.clear()
+
+    stats['duration_ms'] = round((time.perf_counter() - start_time) * 1000, 2)
+    return stats
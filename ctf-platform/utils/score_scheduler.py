@@ -0,0 +1,256 @@
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from models import db, Challenge, Solve
+from utils.scoring import ScoringSystem
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，只能单进程运行
+    fcntl = None
+
+class ScoreScheduler:
+    """
+    动态分数后台调度器
+
+    启用后在工作进程内的后台线程中按 SCORE_SCHEDULER_INTERVAL 秒定期重新计算分数，
+    请求线程不再需要执行全量重算。每轮只读取一次题目的计分输入（解题人数、
+    时间衰减所在天数、初始分数、难度），只对与上一轮相比发生变化的题目调用
+    ScoringSystem.update_challenge_scores。
+
+    多个 gunicorn 工作进程通过对 TEMP_FOLDER 下锁文件加 fcntl 排他锁选举
+    唯一的执行者；执行者进程退出时锁自动释放，由其他进程接管。执行者每轮
+    将运行指标写入共享的 JSON 文件，任一工作进程都可以读取。
+    """
+
+    LOCK_FILE = 'score_scheduler.lock'
+    METRICS_FILE = 'score_scheduler.json'
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock_file = None
+        self._state = None
+        self.app = None
+        self.enabled = False
+        self.interval = 60
+
+        # 运行指标
+        self.is_leader = False
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.total_duration_ms = 0.0
+        self.max_duration_ms = 0.0
+        self.last_run_at = None
+        self.last_duration_ms = None
+        self.last_result = None
+        self.last_error = None
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('SCORE_SCHEDULER_ENABLED', False)
+        self.interval = app.config.get('SCORE_SCHEDULER_INTERVAL', 60)
+        self.lock_path = os.path.join(app.config['TEMP_FOLDER'], self.LOCK_FILE)
+        self.metrics_path = os.path.join(app.config['TEMP_FOLDER'], self.METRICS_FILE)
+
+        if self.enabled:
+            # 在处理请求的工作进程中启动线程（gunicorn 预加载时主进程不会启动）
+            app.before_request(self._ensure_worker)
+
+    def _ensure_worker(self):
+        """按需启动调度线程（兼容 fork 后的工作进程）"""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+
+            if self._pid != os.getpid():
+                # fork 继承的锁文件描述符不属于本进程
+                self._lock_file = None
+                self.is_leader = False
+                self._state = None
+
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='score-scheduler', daemon=True)
+            self._thread.start()
+
+    def _acquire_leadership(self):
+        """尝试成为执行者，已是执行者时直接返回"""
+        if self.is_leader:
+            return True
+
+        if fcntl is None:
+            self.is_leader = True
+            return True
+
+        os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+        lock_file = open(self.lock_path, 'a+')
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+
+        self._lock_file = lock_file
+        self.is_leader = True
+        return True
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(timeout=self.interval)
+            self._wakeup.clear()
+
+            if not self._acquire_leadership():
+                continue
+
+            with self.app.app_context():
+                self.run_once()
+
+    def trigger(self):
+        """唤醒调度线程立即执行一轮（仅在执行者进程中生效）"""
+        self._wakeup.set()
+
+    @staticmethod
+    def _decay_bucket(created_at, now):
+        """时间衰减所在天数，超过最大衰减天数后不再变化"""
+        if created_at is None:
+            return None
+
+        max_days = math.ceil(ScoringSystem.TIME_DECAY_MAX / ScoringSystem.TIME_DECAY_PER_DAY)
+        return min((now - created_at).days, max_days)
+
+    def _snapshot(self):
+        """读取所有题目的计分输入"""
+        now = datetime.utcnow()
+        rows = db.session.query(
+            Challenge.id,
+            Challenge.solved_count,
+            Challenge.created_at,
+            Challenge.base_points,
+            Challenge.difficulty
+        ).all()
+
+        return {
+            challenge_id: (solved_count or 0, self._decay_bucket(created_at, now), base_points, difficulty)
+            for challenge_id, solved_count, created_at, base_points, difficulty in rows
+        }
+
+    def run_once(self):
+        """
+        执行一轮增量重算
+
+        Returns:
+            dict: 检查/变化的题目数和 update_challenge_scores 的统计，失败或跳过时为 None
+        """
+        start_time = time.perf_counter()
+
+        try:
+            if Solve.needs_backfill():
+                # 旧数据库未补全解题记录，按空的解题记录重算会把所有分数清零
+                self.skipped += 1
+                self.last_error = 'solves table is empty but correct submissions exist, run flask upgrade-db first'
+                self.app.logger.warning(f"跳过定时重算分数: {self.last_error}")
+                self._write_metrics()
+                return None
+
+            snapshot = self._snapshot()
+
+            if self._state is None:
+                # 首轮全量重算，同时修正计数偏差
+                changed = None
+            else:
+                changed = [challenge_id for challenge_id, inputs in snapshot.items()
+                           if self._state.get(challenge_id) != inputs]
+
+            stats = ScoringSystem.update_challenge_scores(challenge_ids=changed)
+            self._state = snapshot
+        except Exception as e:
+            db.session.rollback()
+            self.failures += 1
+            self.last_error = str(e)
+            self.app.logger.error(f"定时重算分数失败: {str(e)}")
+            self._write_metrics()
+            return None
+
+        duration_ms = round((time.perf_counter() - start_time) * 1000, 2)
+        result = {
+            'challenges_checked': len(snapshot),
+            'challenges_changed': len(snapshot) if changed is None else len(changed),
+            'full': changed is None,
+            'challenges_updated': stats['challenges_updated'],
+            'users_updated': stats['users_updated']
+        }
+
+        self.runs += 1
+        self.total_duration_ms += duration_ms
+        self.max_duration_ms = max(self.max_duration_ms, duration_ms)
+        self.last_duration_ms = duration_ms
+        self.last_run_at = datetime.utcnow().isoformat()
+        self.last_result = result
+        self.last_error = None
+        self._write_metrics()
+
+        return result
+
+    def _metrics(self):
+        return {
+            'leader_pid': os.getpid(),
+            'interval': self.interval,
+            'runs': self.runs,
+            'failures': self.failures,
+            'skipped': self.skipped,
+            'last_run_at': self.last_run_at,
+            'last_duration_ms': self.last_duration_ms,
+            'avg_duration_ms': round(self.total_duration_ms / self.runs, 2) if self.runs else None,
+            'max_duration_ms': self.max_duration_ms,
+            'last_result': self.last_result,
+            'last_error': self.last_error
+        }
+
+    def _write_metrics(self):
+        """写入共享指标文件，供其他工作进程读取"""
+        try:
+            temp_path = f'{self.metrics_path}.{os.getpid()}'
+            with open(temp_path, 'w') as f:
+                json.dump(self._metrics(), f)
+            os.replace(temp_path, self.metrics_path)
+        except OSError as e:
+            self.app.logger.warning(f"写入调度指标失败: {str(e)}")
+
+    def stats(self):
+        """调度器状态和执行者最近的运行指标"""
+        metrics = None
+        if self.is_leader:
+            metrics = self._metrics()
+        elif self.enabled:
+            try:
+                with open(self.metrics_path) as f:
+                    metrics = json.load(f)
+            except (OSError, ValueError):
+                metrics = None
+
+        return {
+            'enabled': self.enabled,
+            'is_leader': self.is_leader,
+            'pid': os.getpid(),
+            'metrics': metrics
+        }
+
+# 创建全局分数调度器实例
+score_scheduler = ScoreScheduler()
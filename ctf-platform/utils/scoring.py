@@ -1,10 +1,25 @@
+import bisect
 import math
+import time
 from datetime import datetime
 from models import Challenge, Submission
 
 class ScoringSystem:
     """积分计算系统"""
     
+    # 动态计分参数（计分模拟器以此作为基准参数）
+    DIFFICULTY_MULTIPLIERS = {
+        'easy': 0.7,
+        'medium': 1.0,
+        'hard': 1.5,
+        'expert': 2.0
+    }
+    SOLVE_DECAY_CAP = 100       # 解题人数达到该值时衰减达到最大
+    SOLVE_DECAY_MAX = 0.5       # 解题人数衰减的最大比例
+    TIME_DECAY_PER_DAY = 0.01   # 每天的时间衰减比例
+    TIME_DECAY_MAX = 0.5        # 时间衰减的最大比例
+    MIN_POINTS = 100            # 最低分数
+    
     @staticmethod
     def calculate_dynamic_score(challenge, total_solves, time_decay=True, base_points=1000):
         """
@@ -22,8 +37,8 @@ class ScoringSystem:
         if not challenge:
             return 0
         
-        # 基础分数
-        base_score = challenge.points or base_points
+        # 基础分数（使用题目的初始分数，避免多次重算时分数重复衰减）
+        base_score = challenge.base_points or challenge.points or base_points
         
         # 根据难度调整基础分数
         difficulty_multiplier = ScoringSystem._get_difficulty_multiplier(challenge.difficulty)
@@ -31,28 +46,25 @@ class ScoringSystem:
         
         # 根据解题人数调整分数（解题越多，分数越低）
         if total_solves > 0:
-            solve_ratio = min(total_solves / 100, 1.0)  # 假设最多100人解题
-            decay_factor = 1.0 - (solve_ratio * 0.5)    # 最多衰减50%
+            solve_ratio = min(total_solves / ScoringSystem.SOLVE_DECAY_CAP, 1.0)
+            decay_factor = 1.0 - (solve_ratio * ScoringSystem.SOLVE_DECAY_MAX)
             base_score = int(base_score * decay_factor)
         
         # 时间衰减（题目发布越久，分数越低）
         if time_decay and challenge.created_at:
             days_since_creation = (datetime.utcnow() - challenge.created_at).days
-            time_decay_factor = max(0.5, 1.0 - (days_since_creation * 0.01))  # 每天衰减1%，最多衰减50%
+            time_decay_factor = max(
+                1.0 - ScoringSystem.TIME_DECAY_MAX,
+                1.0 - (days_since_creation * ScoringSystem.TIME_DECAY_PER_DAY)
+            )
             base_score = int(base_score * time_decay_factor)
         
-        return max(100, base_score)  # 最低100分
+        return max(ScoringSystem.MIN_POINTS, base_score)
 
     @staticmethod
     def _get_difficulty_multiplier(difficulty):
         """获取难度系数"""
-        multipliers = {
-            'easy': 0.7,
-            'medium': 1.0,
-            'hard': 1.5,
-            'expert': 2.0
-        }
-        return multipliers.get(difficulty.lower(), 1.0)
+        return ScoringSystem.DIFFICULTY_MULTIPLIERS.get(difficulty.lower(), 1.0)
 
     @staticmethod
     def calculate_user_score(user):
@@ -86,30 +98,142 @@ class ScoringSystem:
         return total_score
 
     @staticmethod
-    def update_challenge_scores():
+    def update_challenge_scores(challenge_ids=None):
         """
-        更新所有题目的动态分数
+        更新题目的动态分数，并按解题记录重新计算相关用户的总分
+        
+        全部使用集合查询：一次分组查询获取各题解题人数，一次分组查询汇总
+        各用户得分，只写回发生变化的行。管理员手动调整的用户分数会被覆盖。
+        解题人数和用户总分以增量方式写回，不会覆盖并发提交产生的自增。
+        
+        Args:
+            challenge_ids: 只重新计算这些题目及解过这些题目的用户，默认全部
+        
+        Returns:
+            dict: 题目/用户数量、更新行数和耗时（毫秒）
+        
+        Raises:
+            RuntimeError: 已有正确提交但解题记录为空（旧数据库未执行 flask upgrade-db）
         """
-        from models import db, Challenge
+        from models import db, Challenge, User, Solve
+        from sqlalchemy import func, bindparam
+        
+        start_time = time.perf_counter()
+        
+        if challenge_ids is not None and not challenge_ids:
+            return {
+                'challenges': 0,
+                'challenges_updated': 0,
+                'users': 0,
+                'users_updated': 0,
+                'duration_ms': 0.0
+            }
+        
+        # 解题记录为空时按它计分会把所有分数清零
+        if Solve.needs_backfill():
+            raise RuntimeError('solves table is empty but correct submissions exist, run flask upgrade-db first')
+        
+        # 一次分组查询获取题目的解题人数
+        solve_counts = db.session.query(
+            Solve.challenge_id,
+            func.count(Solve.id)
+        )
+        challenge_query = Challenge.query
+        if challenge_ids is not None:
+            solve_counts = solve_counts.filter(Solve.challenge_id.in_(challenge_ids))
+            challenge_query = challenge_query.filter(Challenge.id.in_(challenge_ids))
         
-        challenges = Challenge.query.all()
+        solve_counts = dict(solve_counts.group_by(Solve.challenge_id).all())
+        challenges = challenge_query.all()
         
+        challenge_updates = []
+        rescored_ids = []
         for challenge in challenges:
-            total_solves = Submission.query.filter_by(
-                challenge_id=challenge.id,
-                is_correct=True
-            ).distinct(Submission.user_id).count()
+            # 旧数据没有初始分数，以当前分数作为初始分数
+            if challenge.base_points is None:
+                challenge.base_points = challenge.points
             
+            total_solves = solve_counts.get(challenge.id, 0)
             new_score = ScoringSystem.calculate_dynamic_score(
                 challenge, 
                 total_solves
             )
             
-            # 更新题目分数
-            challenge.points = new_score
-            challenge.solved_count = total_solves
+            if challenge.points != new_score or (challenge.solved_count or 0) != total_solves:
+                challenge_updates.append({
+                    'challenge_id': challenge.id,
+                    'points': new_score,
+                    'solved_delta': total_solves - (challenge.solved_count or 0)
+                })
+            if challenge.points != new_score:
+                rescored_ids.append(challenge.id)
+        
+        if challenge_updates:
+            challenges_table = Challenge.__table__
+            db.session.execute(
+                challenges_table.update()
+                .where(challenges_table.c.id == bindparam('challenge_id'))
+                .values(
+                    points=bindparam('points'),
+                    solved_count=func.coalesce(challenges_table.c.solved_count, 0) + bindparam('solved_delta')
+                ),
+                challenge_updates
+            )
+        
+        # 一次分组查询按解题记录和新分数汇总用户得分（含血量奖励）
+        user_scores = []
+        if challenge_ids is None or rescored_ids:
+            user_query = db.session.query(
+                User.id,
+                User.score,
+                func.coalesce(func.sum(Challenge.points), 0) + func.coalesce(func.sum(Solve.bonus), 0)
+            ).outerjoin(
+                Solve, Solve.user_id == User.id
+            ).outerjoin(
+                Challenge, Challenge.id == Solve.challenge_id
+            )
+            if challenge_ids is not None:
+                # 只需要重新计算解过分数变化题目的用户
+                affected = db.session.query(Solve.user_id)\
+                    .filter(Solve.challenge_id.in_(rescored_ids))
+                user_query = user_query.filter(User.id.in_(affected))
+            
+            user_scores = user_query.group_by(User.id, User.score).all()
+        
+        user_updates = [
+            {'user_id': user_id, 'score_delta': int(new_score) - (score or 0)}
+            for user_id, score, new_score in user_scores
+            if (score or 0) != int(new_score)
+        ]
+        
+        if user_updates:
+            users_table = User.__table__
+            db.session.execute(
+                users_table.update()
+                .where(users_table.c.id == bindparam('user_id'))
+                .values(score=func.coalesce(users_table.c.score, 0) + bindparam('score_delta')),
+                user_updates
+            )
         
         db.session.commit()
+        
+        # 题目分数已变化，刷新题目目录缓存和排行榜索引
+        from utils.catalog import challenge_catalog
+        from utils.leaderboard import leaderboard_index
+        from utils.auth import identity_cache
+        if challenge_updates:
+            challenge_catalog.bump_version()
+        if user_updates:
+            leaderboard_index.invalidate()
+            identity_cache.clear()
+        
+        return {
+            'challenges': len(challenges),
+            'challenges_updated': len(challenge_updates),
+            'users': len(user_scores),
+            'users_updated': len(user_updates),
+            'duration_ms': round((time.perf_counter() - start_time) * 1000, 2)
+        }
 
     @staticmethod
     def calculate_blood_bonus(position):
@@ -134,6 +258,10 @@ class ScoringSystem:
         """
         获取用户排名
         
+        优先使用内存排行榜索引；未启用时按与索引相同的顺序（分数降序、解题数降序、
+        用户ID升序）计算：分数更高的用户数依赖 users.score 索引，只对同分用户
+        统计解题数，无需加载全部用户。
+        
         Args:
             user_id: 用户ID
         
@@ -141,13 +269,115 @@ class ScoringSystem:
             int: 用户排名
         """
         from models import User
-        from sqlalchemy import desc
+        from sqlalchemy import func
+        from utils.leaderboard import leaderboard_index
+        
+        if leaderboard_index.enabled:
+            return leaderboard_index.get_rank(user_id)
+        
+        user = User.query.get(user_id)
+        if not user or user.is_admin:
+            return None
+        
+        score = user.score or 0
+        higher = User.query.filter(
+            User.is_admin == False,
+            User.score > score
+        ).count()
+        
+        # 同分用户（含自己）按 (-解题数, 用户ID) 排序
+        solved_counts = dict(ScoringSystem._solved_counts(func.coalesce(User.score, 0) == score))
+        tied = sorted((-solved_count, tied_id) for tied_id, solved_count in solved_counts.items())
+        
+        return higher + bisect.bisect_left(tied, (-solved_counts.get(user.id, 0), user.id)) + 1
+
+    @staticmethod
+    def _solved_counts(*criteria):
+        """满足条件的非管理员用户的 (用户ID, 正确提交数)，与排行榜索引的 solved_count 一致"""
+        from models import db, User
+        from sqlalchemy import func, case
+        
+        return db.session.query(
+            User.id,
+            func.count(case((Submission.is_correct == True, Submission.id)))
+        ).outerjoin(
+            Submission, Submission.user_id == User.id
+        ).filter(
+            User.is_admin == False,
+            *criteria
+        ).group_by(User.id).all()
+
+    @staticmethod
+    def ranking_order():
+        """
+        与排行榜索引一致的排序：分数降序、正确提交数降序、用户ID升序
+        
+        Returns:
+            tuple: (正确提交数子查询, 排序表达式列表)，调用方需 outerjoin 子查询
+        """
+        from models import db, User
+        from sqlalchemy import func, desc
+        
+        solved = db.session.query(
+            Submission.user_id,
+            func.count(Submission.id).label('solved_count')
+        ).filter(
+            Submission.is_correct == True
+        ).group_by(Submission.user_id).subquery()
+        
+        return solved, [
+            desc(func.coalesce(User.score, 0)),
+            desc(func.coalesce(solved.c.solved_count, 0)),
+            User.id
+        ]
+
+    @staticmethod
+    def get_users_around(user_id, count=5):
+        """
+        获取用户前后相邻的排名
+        
+        Args:
+            user_id: 用户ID
+            count: 前后各取的数量
+        
+        Returns:
+            list: 包含 rank、user_id、username、score 的字典列表
+        """
+        from models import db, User
+        from utils.leaderboard import leaderboard_index
+        
+        if leaderboard_index.enabled:
+            return [
+                {
+                    'rank': entry['rank'],
+                    'user_id': entry['user_id'],
+                    'username': entry['username'],
+                    'score': entry['score']
+                }
+                for entry in leaderboard_index.get_around(user_id, count)
+            ]
         
-        # 获取所有用户按分数排序
-        users = User.query.filter_by(is_admin=False).order_by(desc(User.score)).all()
+        rank = ScoringSystem.get_user_rank(user_id)
+        if rank is None:
+            return []
         
-        for rank, user in enumerate(users, start=1):
-            if user.id == user_id:
-                return rank
+        # 按与排行榜索引相同的顺序取排名 [rank - count, rank + count] 的用户
+        solved, order = ScoringSystem.ranking_order()
+        first_rank = max(1, rank - count)
+        neighbours = db.session.query(
+            User.id, User.username, User.score
+        ).outerjoin(
+            solved, solved.c.user_id == User.id
+        ).filter(
+            User.is_admin == False
+        ).order_by(*order).offset(first_rank - 1).limit(rank + count - first_rank + 1).all()
         
-        return None
\ No newline at end of file
+        return [
+            {
+                'rank': first_rank + offset,
+                'user_id': neighbour.id,
+                'username': neighbour.username,
+                'score': neighbour.score or 0
+            }
+            for offset, neighbour in enumerate(neighbours)
+        ]
@@ -0,0 +1,258 @@
+import json
+import time
+from itertools import chain
+from datetime import datetime
+from sqlalchemy import func
+from models import db, User, Challenge, Solve
+from utils.scoring import ScoringSystem
+
+try:
+    import numpy as np
+except ImportError:  # numpy 为可选依赖，仅计分模拟需要
+    np = None
+
+def default_scoring_params():
+    """当前 ScoringSystem 使用的动态计分参数"""
+    return {
+        'difficulty_multipliers': dict(ScoringSystem.DIFFICULTY_MULTIPLIERS),
+        'solve_decay_cap': ScoringSystem.SOLVE_DECAY_CAP,
+        'solve_decay_max': ScoringSystem.SOLVE_DECAY_MAX,
+        'time_decay': True,
+        'time_decay_per_day': ScoringSystem.TIME_DECAY_PER_DAY,
+        'time_decay_max': ScoringSystem.TIME_DECAY_MAX,
+        'min_points': ScoringSystem.MIN_POINTS
+    }
+
+def parse_overrides(items):
+    """
+    解析命令行参数覆盖
+
+    Args:
+        items: KEY=VALUE 字符串列表，难度系数使用 difficulty.<难度>=<系数>
+
+    Returns:
+        dict: 参数覆盖字典
+    """
+    params = {}
+    for item in items:
+        key, sep, value = item.partition('=')
+        if not sep:
+            raise ValueError(f'Invalid parameter override: {item}')
+
+        try:
+            value = json.loads(value)
+        except ValueError:
+            pass
+
+        key = key.strip()
+        if key.startswith('difficulty.'):
+            params.setdefault('difficulty_multipliers', {})[key[len('difficulty.'):]] = value
+        else:
+            params[key] = value
+
+    return params
+
+def merge_params(overrides):
+    """在默认参数上应用覆盖，未知参数报错"""
+    params = default_scoring_params()
+    for key, value in (overrides or {}).items():
+        if key == 'name':
+            continue
+        if key not in params:
+            raise ValueError(f'Unknown scoring parameter: {key}')
+        if key == 'difficulty_multipliers':
+            params[key].update(value)
+        else:
+            params[key] = value
+    return params
+
+class ScoreSimulator:
+    """
+    动态计分模拟器
+
+    一次性将解题记录、题目和用户加载为 NumPy 列数组，之后每组计分参数
+    都在所有题目和用户上向量化计算（与 calculate_dynamic_score 的取整
+    规则一致），并与当前参数的排名做对比。只读，不修改数据库。
+    """
+
+    def __init__(self):
+        if np is None:
+            raise RuntimeError('numpy package is required for the score simulator')
+
+        self.loaded = False
+        self.load_ms = 0.0
+
+    def load(self):
+        """从数据库加载列数组"""
+        start_time = time.perf_counter()
+
+        users = db.session.query(User.id, User.username)\
+            .filter(User.is_admin == False)\
+            .order_by(User.id).all()
+        self.user_ids = np.array([row[0] for row in users], dtype=np.int64)
+        self.usernames = [row[1] for row in users]
+
+        challenges = db.session.query(
+            Challenge.id,
+            Challenge.base_points,
+            Challenge.points,
+            Challenge.difficulty,
+            Challenge.created_at
+        ).order_by(Challenge.id).all()
+        self.challenge_ids = np.array([row[0] for row in challenges], dtype=np.int64)
+        self.base_points = np.array([row[1] or row[2] or 1000 for row in challenges], dtype=np.float64)
+        self.difficulties = np.array([(row[3] or '').lower() for row in challenges], dtype=object)
+        self.created_at = np.array(
+            [row[4] if row[4] else 'NaT' for row in challenges], dtype='datetime64[s]'
+        )
+
+        rows = db.session.query(
+            Solve.user_id, Solve.challenge_id, func.coalesce(Solve.bonus, 0)
+        ).all()
+        solves = np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=len(rows) * 3)\
+            .reshape(-1, 3)
+
+        # 只保留排行榜用户（非管理员）和仍存在的题目，转换为稠密下标
+        keep = np.isin(solves[:, 0], self.user_ids) & np.isin(solves[:, 1], self.challenge_ids)
+        solves = solves[keep]
+        self.solve_users = np.searchsorted(self.user_ids, solves[:, 0])
+        self.solve_challenges = np.searchsorted(self.challenge_ids, solves[:, 1])
+
+        # 血量奖励在解题时确定，不随计分参数变化
+        self.user_bonus = np.bincount(
+            self.solve_users, weights=solves[:, 2], minlength=len(self.user_ids)
+        ).astype(np.int64)
+
+        self.solve_counts = np.bincount(self.solve_challenges, minlength=len(self.challenge_ids))
+        self.user_solved = np.bincount(self.solve_users, minlength=len(self.user_ids))
+
+        self.loaded = True
+        self.load_ms = round((time.perf_counter() - start_time) * 1000, 2)
+        return self
+
+    def evaluate(self, params=None, as_of=None):
+        """
+        按一组参数计算所有题目分数、用户得分和排名
+
+        Args:
+            params: 计分参数覆盖（见 default_scoring_params）
+            as_of: 计算时间衰减的时间点，默认为当前时间
+
+        Returns:
+            dict: points（题目分数）、scores（用户得分）、ranks（用户排名）
+        """
+        if not self.loaded:
+            self.load()
+
+        params = merge_params(params)
+        as_of = np.datetime64(as_of or datetime.utcnow(), 's')
+
+        multipliers = params['difficulty_multipliers']
+        multiplier = np.array(
+            [multipliers.get(difficulty, 1.0) for difficulty in self.difficulties], dtype=np.float64
+        )
+        points = np.floor(self.base_points * multiplier)
+
+        solve_ratio = np.minimum(self.solve_counts / params['solve_decay_cap'], 1.0)
+        points = np.floor(points * (1.0 - solve_ratio * params['solve_decay_max']))
+
+        if params['time_decay']:
+            has_date = ~np.isnat(self.created_at)
+            days = np.zeros(len(self.challenge_ids), dtype=np.int64)
+            days[has_date] = (as_of - self.created_at[has_date]).astype(np.int64) // 86400
+            factor = np.maximum(1.0 - params['time_decay_max'], 1.0 - days * params['time_decay_per_day'])
+            points = np.where(has_date, np.floor(points * factor), points)
+
+        points = np.maximum(params['min_points'], points).astype(np.int64)
+
+        scores = np.bincount(
+            self.solve_users,
+            weights=points[self.solve_challenges],
+            minlength=len(self.user_ids)
+        ).astype(np.int64) + self.user_bonus
+
+        # 与排行榜相同的排序：分数降序、解题数降序、用户ID升序
+        order = np.lexsort((self.user_ids, -self.user_solved, -scores))
+        ranks = np.empty(len(order), dtype=np.int64)
+        ranks[order] = np.arange(1, len(order) + 1)
+
+        return {
+            'params': params,
+            'points': points,
+            'scores': scores,
+            'ranks': ranks,
+            'order': order
+        }
+
+    def compare(self, baseline, candidate, top=20):
+        """
+        对比两次计算结果的排名变化
+
+        Args:
+            baseline: 基准结果
+            candidate: 候选结果
+            top: 输出的排名变化最大的用户数和前几名数量
+
+        Returns:
+            dict: 变化统计、变化最大的用户和候选参数下的前几名
+        """
+        delta = baseline['ranks'] - candidate['ranks']
+        moved = np.flatnonzero(delta)
+        biggest = moved[np.argsort(-np.abs(delta[moved]), kind='stable')][:top]
+        top_before = set(baseline['order'][:top].tolist())
+        top_after = candidate['order'][:top]
+
+        return {
+            'challenges_changed': int(np.count_nonzero(baseline['points'] != candidate['points'])),
+            'users_moved': int(len(moved)),
+            'max_rise': max(int(delta.max()), 0) if len(delta) else 0,
+            'max_drop': max(int(-delta.min()), 0) if len(delta) else 0,
+            'top_changed': int(sum(1 for index in top_after.tolist() if index not in top_before)),
+            'movers': [self._row(index, baseline, candidate) for index in biggest.tolist()],
+            'standings': [self._row(index, baseline, candidate) for index in top_after.tolist()]
+        }
+
+    def _row(self, index, baseline, candidate):
+        return {
+            'user_id': int(self.user_ids[index]),
+            'username': self.usernames[index],
+            'old_rank': int(baseline['ranks'][index]),
+            'new_rank': int(candidate['ranks'][index]),
+            'old_score': int(baseline['scores'][index]),
+            'new_score': int(candidate['scores'][index])
+        }
+
+    def simulate(self, param_sets, as_of=None, top=20):
+        """
+        以当前参数为基准，模拟多组计分参数
+
+        Args:
+            param_sets: 参数覆盖字典列表，可带 name 字段
+            as_of: 计算时间衰减的时间点
+            top: 每组输出的用户数
+
+        Returns:
+            dict: 数据规模、耗时和每组参数的对比结果
+        """
+        if not self.loaded:
+            self.load()
+
+        start_time = time.perf_counter()
+        baseline = self.evaluate(as_of=as_of)
+
+        results = []
+        for position, overrides in enumerate(param_sets, start=1):
+            candidate = self.evaluate(overrides, as_of=as_of)
+            result = self.compare(baseline, candidate, top)
+            result['name'] = overrides.get('name') or f'set-{position}'
+            result['params'] = candidate['params']
+            results.append(result)
+
+        return {
+            'users': len(self.user_ids),
+            'challenges': len(self.challenge_ids),
+            'solves': len(self.solve_users),
+            'load_ms': self.load_ms,
+            'simulate_ms': round((time.perf_counter() - start_time) * 1000, 2),
+            'results': results
+        }
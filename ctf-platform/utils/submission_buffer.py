@@ -0,0 +1,220 @@
+import atexit
+import os
+import threading
+import time
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from models import db, Submission
+from utils.submission_stats import record_submissions
+
+class SubmissionBuffer:
+    """
+    错误提交写后缓冲
+
+    启用后，错误的 Flag 提交先放入内存队列，由后台线程在数量达到
+    SUBMISSION_BUFFER_SIZE 或最早一条等待超过 SUBMISSION_BUFFER_MAX_LAG 秒时
+    以多行 INSERT 批量写入并提交一次事务。正确提交仍同步写入。
+    进程退出时会刷新剩余数据。
+
+    - 队列达到 SUBMISSION_BUFFER_LIMIT 时 add() 返回 False，调用方改为同步写入
+    - 批中有违反约束的行（如缓冲期间用户或题目被删除）时二分拆批写入，
+      单独写入仍失败的行记录日志后丢弃，不影响其他行
+    - 数据库暂时不可用时未写入的数据放回队列等待下次刷新，超出上限的最早数据被丢弃
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._rows = []
+        self._oldest = None
+        self._thread = None
+        self._pid = None
+        self.app = None
+        self.enabled = False
+        self.max_size = 500
+        self.max_lag = 1.0
+        self.limit = 10000
+
+        # 统计信息
+        self.flushed_rows = 0
+        self.flush_count = 0
+        self.failed_flushes = 0
+        self.dropped_rows = 0
+        self.rejected_rows = 0
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('SUBMISSION_BUFFER_ENABLED', False)
+        self.max_size = app.config.get('SUBMISSION_BUFFER_SIZE', 500)
+        self.max_lag = app.config.get('SUBMISSION_BUFFER_MAX_LAG', 1.0)
+        self.limit = max(self.max_size, app.config.get('SUBMISSION_BUFFER_LIMIT', 10000))
+
+        if self.enabled:
+            atexit.register(self.flush)
+
+    def _ensure_worker(self):
+        """按需启动刷新线程（兼容 fork 后的工作进程）"""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name='submission-buffer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(timeout=self.max_lag)
+            self._wakeup.clear()
+
+            with self._lock:
+                due = self._rows and (
+                    len(self._rows) >= self.max_size or
+                    time.monotonic() - self._oldest >= self.max_lag
+                )
+
+            if due:
+                self.flush()
+
+    def add(self, user_id, challenge_id, flag_submitted, submitted_at):
+        """
+        缓冲一条错误提交
+
+        Args:
+            user_id: 用户ID
+            challenge_id: 题目ID
+            flag_submitted: 提交的Flag
+            submitted_at: 提交时间
+
+        Returns:
+            bool: 是否已放入队列，队列已满时返回 False
+        """
+        with self._lock:
+            if len(self._rows) >= self.limit:
+                self.rejected_rows += 1
+                return False
+            if not self._rows:
+                self._oldest = time.monotonic()
+            self._rows.append({
+                'user_id': user_id,
+                'challenge_id': challenge_id,
+                'flag_submitted': flag_submitted,
+                'is_correct': False,
+                'submitted_at': submitted_at
+            })
+            full = len(self._rows) >= self.max_size
+
+        self._ensure_worker()
+        if full:
+            self._wakeup.set()
+        return True
+
+    def pending(self):
+        """队列中等待写入的提交数"""
+        return len(self._rows)
+
+    def discard(self, user_id=None, challenge_id=None):
+        """
+        丢弃队列中属于指定用户或题目的提交（删除用户或题目前调用）
+
+        Returns:
+            int: 丢弃的提交数
+        """
+        with self._lock:
+            rows = [
+                row for row in self._rows
+                if not (row['user_id'] == user_id or row['challenge_id'] == challenge_id)
+            ]
+            discarded = len(self._rows) - len(rows)
+            self._rows = rows
+            if not rows:
+                self._oldest = None
+
+        return discarded
+
+    def _insert(self, rows):
+        """在一个事务中写入一批提交并更新提交计数"""
+        try:
+            db.session.execute(insert(Submission), rows)
+            record_submissions(rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def flush(self):
+        """
+        将缓冲的提交批量写入数据库
+
+        Returns:
+            int: 写入的提交数
+        """
+        with self._lock:
+            rows, self._rows = self._rows, []
+            self._oldest = None
+
+        if not rows:
+            return 0
+
+        # 待写入的批次栈，按原顺序从栈顶取出
+        pending = [rows]
+        written = 0
+        try:
+            with self.app.app_context():
+                while pending:
+                    chunk = pending[-1]
+                    try:
+                        self._insert(chunk)
+                    except IntegrityError as e:
+                        pending.pop()
+                        if len(chunk) > 1:
+                            # 拆成两半分别写入，定位违反约束的行
+                            middle = len(chunk) // 2
+                            pending.extend((chunk[middle:], chunk[:middle]))
+                        else:
+                            row = chunk[0]
+                            self.dropped_rows += 1
+                            self.app.logger.error(
+                                f"丢弃无法写入的提交记录: User:{row['user_id']} - "
+                                f"Challenge:{row['challenge_id']} - {str(e.orig)}"
+                            )
+                        continue
+                    pending.pop()
+                    written += len(chunk)
+        except Exception as e:
+            # 数据库暂时不可用时放回队列等待下次刷新，超出上限的最早数据被丢弃
+            remaining = [row for chunk in reversed(pending) for row in chunk]
+            with self._lock:
+                self._rows = remaining + self._rows
+                overflow = len(self._rows) - self.limit
+                if overflow > 0:
+                    del self._rows[:overflow]
+                    self.dropped_rows += overflow
+                self._oldest = time.monotonic()
+                self.failed_flushes += 1
+                self.flushed_rows += written
+            self.app.logger.error(f"批量写入提交记录失败: {str(e)}")
+            return written
+
+        with self._lock:
+            self.flushed_rows += written
+            self.flush_count += 1
+
+        return written
+
+    def stats(self):
+        """缓冲统计信息"""
+        return {
+            'enabled': self.enabled,
+            'pending': self.pending(),
+            'flushed_rows': self.flushed_rows,
+            'flush_count': self.flush_count,
+            'failed_flushes': self.failed_flushes,
+            'dropped_rows': self.dropped_rows,
+            'rejected_rows': self.rejected_rows
+        }
+
+# 创建全局提交缓冲实例
+submission_buffer = SubmissionBuffer()
@@ -0,0 +1,223 @@
+import datetime
+from collections import defaultdict
+from flask import current_app
+from sqlalchemy import func, case
+from sqlalchemy.exc import IntegrityError
+from models import db, Submission, SubmissionCounter, SubmissionHourlyCounter
+
+# 统计“最近提交”的时间窗口
+RECENT_WINDOW = datetime.timedelta(days=7)
+
+# 计数已从提交记录重建的标记行（用户ID为正数，全局分片为负数）
+INITIALIZED_SCOPE = 0
+
+def _hour_bucket(moment):
+    """截断到整点"""
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+def _shard_count():
+    return max(1, current_app.config.get('SUBMISSION_COUNTER_SHARDS', 8))
+
+def _increment(model, key, total, correct):
+    """
+    原子递增一行计数，不存在时插入
+
+    Args:
+        model: 计数模型
+        key: 主键字段字典
+        total: 提交数增量
+        correct: 正确提交数增量
+    """
+    values = {
+        model.total: model.total + total,
+        model.correct: model.correct + correct
+    }
+
+    if model.query.filter_by(**key).update(values, synchronize_session=False):
+        return
+
+    try:
+        with db.session.begin_nested():
+            db.session.add(model(total=total, correct=correct, **key))
+    except IntegrityError:
+        # 并发插入了同一行，改为递增
+        model.query.filter_by(**key).update(values, synchronize_session=False)
+
+def record_submissions(rows):
+    """
+    在当前事务中更新提交计数（调用方负责提交事务）
+
+    Args:
+        rows: 包含 user_id、is_correct、submitted_at 的字典列表
+    """
+    shards = _shard_count()
+    by_scope = defaultdict(lambda: [0, 0])
+    by_hour = defaultdict(lambda: [0, 0])
+
+    for row in rows:
+        correct = 1 if row['is_correct'] else 0
+        shard = row['user_id'] % shards
+        submitted_at = row.get('submitted_at') or datetime.datetime.utcnow()
+
+        for counts in (by_scope[row['user_id']],
+                       by_scope[-(shard + 1)],
+                       by_hour[(_hour_bucket(submitted_at), shard)]):
+            counts[0] += 1
+            counts[1] += correct
+
+    # 按主键顺序更新，减少并发事务之间的死锁
+    for scope_id in sorted(by_scope):
+        total, correct = by_scope[scope_id]
+        _increment(SubmissionCounter, {'scope_id': scope_id}, total, correct)
+
+    for hour, shard in sorted(by_hour):
+        total, correct = by_hour[(hour, shard)]
+        _increment(SubmissionHourlyCounter, {'hour': hour, 'shard': shard}, total, correct)
+
+def record_submission(user_id, is_correct, submitted_at=None):
+    """
+    在当前事务中记录一次提交
+
+    Args:
+        user_id: 用户ID
+        is_correct: 是否正确
+        submitted_at: 提交时间
+    """
+    record_submissions([{
+        'user_id': user_id,
+        'is_correct': is_correct,
+        'submitted_at': submitted_at
+    }])
+
+def remove_submissions(user_id=None, challenge_id=None):
+    """
+    在当前事务中从计数里扣除将被删除的提交（删除用户或题目的提交前调用，调用方负责提交事务）
+
+    删除用户时同时删除该用户的计数行。
+
+    Args:
+        user_id: 删除该用户的提交
+        challenge_id: 删除该题目的提交
+    """
+    shards = _shard_count()
+    criteria = []
+    if user_id is not None:
+        criteria.append(Submission.user_id == user_id)
+    if challenge_id is not None:
+        criteria.append(Submission.challenge_id == challenge_id)
+
+    per_user = db.session.query(
+        Submission.user_id,
+        func.count(Submission.id),
+        func.sum(case((Submission.is_correct == True, 1), else_=0))
+    ).filter(*criteria).group_by(Submission.user_id).all()
+
+    by_scope = defaultdict(lambda: [0, 0])
+    for scope_user_id, total, correct in per_user:
+        for counts in (by_scope[scope_user_id], by_scope[-(scope_user_id % shards + 1)]):
+            counts[0] += total
+            counts[1] += int(correct or 0)
+
+    # 只读取最近窗口内的小时分桶
+    since = _hour_bucket(datetime.datetime.utcnow() - RECENT_WINDOW)
+    by_hour = defaultdict(lambda: [0, 0])
+    recent = db.session.query(Submission.user_id, Submission.is_correct, Submission.submitted_at)\
+        .filter(Submission.submitted_at >= since, *criteria)\
+        .yield_per(10000)
+    for scope_user_id, is_correct, submitted_at in recent:
+        counts = by_hour[(_hour_bucket(submitted_at), scope_user_id % shards)]
+        counts[0] += 1
+        counts[1] += 1 if is_correct else 0
+
+    # 按主键顺序更新，减少与提交事务之间的死锁；不存在的行无需扣除
+    for scope_id in sorted(by_scope):
+        total, correct = by_scope[scope_id]
+        SubmissionCounter.query.filter_by(scope_id=scope_id).update({
+            SubmissionCounter.total: SubmissionCounter.total - total,
+            SubmissionCounter.correct: SubmissionCounter.correct - correct
+        }, synchronize_session=False)
+
+    for hour, shard in sorted(by_hour):
+        total, correct = by_hour[(hour, shard)]
+        SubmissionHourlyCounter.query.filter_by(hour=hour, shard=shard).update({
+            SubmissionHourlyCounter.total: SubmissionHourlyCounter.total - total,
+            SubmissionHourlyCounter.correct: SubmissionHourlyCounter.correct - correct
+        }, synchronize_session=False)
+
+    if user_id is not None:
+        SubmissionCounter.query.filter_by(scope_id=user_id).delete(synchronize_session=False)
+
+def rebuild_submission_counters():
+    """从提交记录重建所有计数（首次启用或计数与提交记录不一致时调用）"""
+    shards = _shard_count()
+    SubmissionCounter.query.delete()
+    SubmissionHourlyCounter.query.delete()
+
+    per_user = db.session.query(
+        Submission.user_id,
+        func.count(Submission.id),
+        func.sum(case((Submission.is_correct == True, 1), else_=0))
+    ).group_by(Submission.user_id).all()
+
+    global_counts = defaultdict(lambda: [0, 0])
+    for user_id, total, correct in per_user:
+        db.session.add(SubmissionCounter(scope_id=user_id, total=total, correct=int(correct or 0)))
+        counts = global_counts[-(user_id % shards + 1)]
+        counts[0] += total
+        counts[1] += int(correct or 0)
+
+    for scope_id, (total, correct) in global_counts.items():
+        db.session.add(SubmissionCounter(scope_id=scope_id, total=total, correct=correct))
+
+    # 初始化标记，提交时的递增不会创建这一行
+    db.session.add(SubmissionCounter(scope_id=INITIALIZED_SCOPE, total=0, correct=0))
+
+    # 只需要最近窗口内的小时分桶
+    since = _hour_bucket(datetime.datetime.utcnow() - RECENT_WINDOW)
+    hourly = defaultdict(lambda: [0, 0])
+    recent = db.session.query(Submission.user_id, Submission.is_correct, Submission.submitted_at)\
+        .filter(Submission.submitted_at >= since)\
+        .yield_per(10000)
+    for user_id, is_correct, submitted_at in recent:
+        counts = hourly[(_hour_bucket(submitted_at), user_id % shards)]
+        counts[0] += 1
+        counts[1] += 1 if is_correct else 0
+
+    for (hour, shard), (total, correct) in hourly.items():
+        db.session.add(SubmissionHourlyCounter(hour=hour, shard=shard, total=total, correct=correct))
+
+    db.session.commit()
+
+def read_submission_stats(user_id):
+    """
+    读取全局和用户的提交统计
+
+    Args:
+        user_id: 用户ID
+
+    Returns:
+        dict: 全局总数/正确数、用户总数/正确数、最近提交数
+    """
+    # 计数表在重建前已有提交写入的行，只能以初始化标记判断是否重建过
+    if SubmissionCounter.query.get(INITIALIZED_SCOPE) is None:
+        rebuild_submission_counters()
+
+    total, correct = db.session.query(
+        func.sum(SubmissionCounter.total),
+        func.sum(SubmissionCounter.correct)
+    ).filter(SubmissionCounter.scope_id < 0).one()
+
+    user_counter = SubmissionCounter.query.get(user_id)
+
+    since = _hour_bucket(datetime.datetime.utcnow() - RECENT_WINDOW)
+    recent = db.session.query(func.sum(SubmissionHourlyCounter.total))\
+        .filter(SubmissionHourlyCounter.hour >= since)\
+        .scalar()
+
+    return {
+        'total_submissions': int(total or 0),
+        'correct_submissions': int(correct or 0),
+        'user_total': user_counter.total if user_counter else 0,
+        'user_correct': user_counter.correct if user_counter else 0,
+        'recent_submissions': int(recent or 0)
+    }
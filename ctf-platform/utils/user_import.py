@@ -0,0 +1,188 @@
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import repeat
+from flask import current_app
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+from models import db, User
+
+# 最多记录的错误行数
+MAX_ERRORS = 100
+
+def _hash_password(password, method):
+    """在工作进程中生成密码哈希"""
+    if method:
+        return generate_password_hash(password, method=method)
+    return generate_password_hash(password)
+
+def _key(value):
+    """用户名/邮箱的比较键：MySQL 的 utf8mb4_unicode_ci 排序规则不区分大小写"""
+    return value.casefold()
+
+def _existing(rows):
+    """
+    两次 IN 查询获取已被占用的用户名和邮箱（返回比较键）
+
+    不区分大小写的排序规则下 IN 查询本身会匹配大小写变体，仍可使用唯一索引；
+    结果统一转为比较键后与文件中的值比较。
+    """
+    usernames = db.session.query(User.username)\
+        .filter(User.username.in_([row['username'] for row in rows])).all()
+    emails = db.session.query(User.email)\
+        .filter(User.email.in_([row['email'] for row in rows])).all()
+    return {_key(row[0]) for row in usernames} | {_key(row[0]) for row in emails}
+
+def _read_batches(path, batch_size):
+    """流式读取 CSV，按批返回 (行号, 行数据) 列表"""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        missing = {'username', 'email', 'password'} - set(reader.fieldnames or [])
+        if missing:
+            raise ValueError(f"CSV is missing columns: {', '.join(sorted(missing))}")
+
+        batch = []
+        for row in reader:
+            batch.append((reader.line_num, row))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+def import_users(path, batch_size=1000, workers=None, dry_run=False):
+    """
+    从 CSV 批量导入用户
+
+    CSV 需包含 username、email、password 列。按批流式读取：每批用两次 IN
+    查询检查用户名/邮箱是否已存在（文件内重复在内存中检查，均不区分大小写），
+    在进程池中并行计算密码哈希（使用 PASSWORD_HASH_METHOD，未设置时为 werkzeug
+    默认值），再以多行 INSERT 写入并提交。已存在或重复的用户跳过。
+
+    多行 INSERT 违反唯一约束时（检查后有用户通过其他途径注册，或数据库排序规则
+    认为相同的值，如重音变体），该批改为逐行写入，跳过并报告冲突的行。
+
+    Args:
+        path: CSV 文件路径
+        batch_size: 每批处理的行数
+        workers: 哈希进程数，默认为 CPU 核数
+        dry_run: 只校验，不计算哈希也不写入
+
+    Returns:
+        dict: 各类行数、错误列表、耗时和每秒导入用户数
+    """
+    start_time = time.perf_counter()
+    method = current_app.config.get('PASSWORD_HASH_METHOD')
+
+    stats = {
+        'rows': 0,
+        'created': 0,
+        'existing': 0,
+        'duplicates': 0,
+        'invalid': 0,
+        'errors': []
+    }
+    seen_usernames = set()
+    seen_emails = set()
+
+    def reject(line, reason, key):
+        stats[key] += 1
+        if len(stats['errors']) < MAX_ERRORS:
+            stats['errors'].append({'line': line, 'error': reason})
+
+    executor = None if dry_run else ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+    try:
+        for batch in _read_batches(path, batch_size):
+            stats['rows'] += len(batch)
+
+            # 校验必填字段并去除文件内重复
+            candidates = []
+            for line, row in batch:
+                username = (row.get('username') or '').strip()
+                email = (row.get('email') or '').strip()
+                password = row.get('password') or ''
+
+                if not username or not email or not password:
+                    reject(line, 'username, email and password are required', 'invalid')
+                    continue
+                if _key(username) in seen_usernames or _key(email) in seen_emails:
+                    reject(line, f'duplicate username or email in file: {username}', 'duplicates')
+                    continue
+
+                seen_usernames.add(_key(username))
+                seen_emails.add(_key(email))
+                candidates.append((line, username, email, password))
+
+            if not candidates:
+                continue
+
+            # 每批两次查询检查已存在的用户名和邮箱
+            taken = _existing([{'username': c[1], 'email': c[2]} for c in candidates])
+
+            new_users = []
+            for line, username, email, password in candidates:
+                if _key(username) in taken or _key(email) in taken:
+                    reject(line, f'username or email already exists: {username}', 'existing')
+                    continue
+                new_users.append((line, username, email, password))
+
+            if dry_run or not new_users:
+                stats['created'] += len(new_users)
+                continue
+
+            # 进程池并行计算密码哈希
+            chunksize = max(1, len(new_users) // ((workers or os.cpu_count() or 1) * 4))
+            hashes = executor.map(
+                _hash_password,
+                [user[3] for user in new_users],
+                repeat(method),
+                chunksize=chunksize
+            )
+
+            now = datetime.utcnow()
+            rows = [
+                {
+                    'username': username,
+                    'email': email,
+                    'password_hash': password_hash,
+                    'is_admin': False,
+                    'score': 0,
+                    'is_active': True,
+                    'created_at': now
+                }
+                for (_, username, email, _), password_hash in zip(new_users, hashes)
+            ]
+
+            try:
+                db.session.execute(insert(User), rows)
+                db.session.commit()
+                stats['created'] += len(rows)
+            except IntegrityError:
+                # 逐行写入（每行一个保存点），跳过并报告违反唯一约束的行
+                db.session.rollback()
+                for (line, username, _, _), row in zip(new_users, rows):
+                    try:
+                        with db.session.begin_nested():
+                            db.session.execute(insert(User), [row])
+                    except IntegrityError:
+                        reject(line, f'username or email already exists: {username}', 'existing')
+                        continue
+                    stats['created'] += 1
+                db.session.commit()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    duration = time.perf_counter() - start_time
+    stats['duration_ms'] = round(duration * 1000, 2)
+    stats['users_per_second'] = round(stats['created'] / duration, 1) if duration and not dry_run else None
+
+    if stats['created']:
+        # 新用户需要出现在排行榜中
+        from utils.leaderboard import leaderboard_index
+        leaderboard_index.invalidate()
+
+    return stats